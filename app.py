@@ -1,17 +1,16 @@
 import ttkbootstrap as tb
 import customtkinter as ctk
 from customtkinter import CTkImage
-import tableauserverclient as TSC
 from tkinter import messagebox, filedialog
 import threading
 import os
 import sys
 from collections import defaultdict
-from tableau_fetch import TableauFetcher
-from process_elite_and_larkin import process_excel_file
-from oldest_dos import get_oldest_dos
-from process_concord import process_concord
-from PIL import Image, ImageSequence
+from instrumentation import Tracer
+from log_sink import LogSink
+
+# Concord CSVs are streamed through process_concord this many rows at a time
+CONCORD_CHUNKSIZE = 100_000
 
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("dark-blue")
@@ -24,6 +23,12 @@ def get_resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+def warm_imports():
+    """ Import the pandas / Tableau / PIL stack; run in the background once the login window is up """
+    import tableau_session, tableau_cache, tableau_fetch
+    import process_elite_and_larkin, process_concord, oldest_dos, upload_loader
+    from PIL import Image, ImageSequence
+
 class TableauApp(tb.Window):
     def __init__(self):
         super().__init__(themename="cyborg")
@@ -32,6 +37,9 @@ class TableauApp(tb.Window):
         self.resizable(False, False)
 
         self.credentials = {}
+        # Shared output_callback; batches text into the output box and keeps a log file
+        self.log = LogSink()
+        self.log.capture_warnings()
 
         # Initialize frames
         self.login_frame = ctk.CTkFrame(self)
@@ -42,6 +50,16 @@ class TableauApp(tb.Window):
 
         self.login_frame.pack(fill="both", expand=True)
 
+        # Heavy modules load after the first paint instead of before the window appears
+        self.spinner_frames = None
+        self.spinner_job = None
+        self.after_idle(lambda: threading.Thread(target=warm_imports, daemon=True).start())
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.log.close()
+        self.destroy()
+
     def build_login_frame(self):
         container = self.login_frame
 
@@ -77,19 +95,30 @@ class TableauApp(tb.Window):
             self.error_label.configure(text="Username and password are required.")
             return
         try:
-            auth = TSC.TableauAuth(user, pw, '')
-            server = TSC.Server("https://tableau.blitzmedical.com", use_server_version=True)
-            with server.auth.sign_in(auth):
-                self.credentials['username'] = user
-                self.credentials['password'] = pw
-                self.fetcher = TableauFetcher(
-                    username=user,
-                    password=pw,
-                    output_callback=self.append_output,
-                    progress_callback=self.update_progress
-                )
-                self.login_frame.pack_forget()
-                self.main_frame.pack(fill="both", expand=True)
+            from tableau_session import TableauSession
+            from tableau_cache import TableauCache
+            from tableau_fetch import TableauFetcher
+
+            session = TableauSession(user, pw)
+            session.sign_in()
+            self.credentials['username'] = user
+            self.credentials['password'] = pw
+            try:
+                cache = TableauCache()
+            except ImportError:
+                # No parquet engine installed, fetch everything each time
+                cache = None
+            self.fetcher = TableauFetcher(
+                username=user,
+                password=pw,
+                output_callback=self.append_output,
+                progress_callback=self.update_progress,
+                window_days=7,
+                cache=cache,
+                session=session
+            )
+            self.login_frame.pack_forget()
+            self.main_frame.pack(fill="both", expand=True)
         except Exception:
             self.error_label.configure(text="Invalid login credentials. Please try again.")
 
@@ -97,6 +126,10 @@ class TableauApp(tb.Window):
         self.encounter_lookup = defaultdict(lambda: defaultdict(list))
         self.df_tableau = None
         self.uploaded_file_path = None
+        self.stages = {}
+        self.upload_run = 0
+        self.tracer = None
+        self.previous_output = None
 
         label_font = ("Segoe UI", 14)
 
@@ -114,10 +147,15 @@ class TableauApp(tb.Window):
         self.progress.set(0)  # Set initial value
         self.progress.pack(pady=10)
 
+        # Fetch and upload parsing run side by side, each with its own status
+        self.stage_label = ctk.CTkLabel(self.main_frame, text="", font=("Segoe UI", 12))
+        self.stage_label.pack()
+
         # Modern text box
         self.output_text = ctk.CTkTextbox(self.main_frame, height=250, width=675, font=("Consolas", 13))
         self.output_text.pack(pady=10)
         self.output_text.configure(state="disabled")
+        self.log.attach(self.output_text)
 
         # Button container with rounded buttons
         btn_frame = ctk.CTkFrame(self.main_frame, fg_color="transparent")  # keep transparent for layout only
@@ -131,6 +169,17 @@ class TableauApp(tb.Window):
                                         command=self.start_processing)
         self.process_btn.pack(side="left", padx=10)
 
+        self.previous_btn = ctk.CTkButton(btn_frame, text="Previous Output...", width=150,
+                                          command=self.choose_previous_output)
+        self.previous_btn.pack(side="left", padx=10)
+
+        self.auto_process = ctk.BooleanVar(value=True)
+        ctk.CTkCheckBox(btn_frame, text="Process automatically", variable=self.auto_process).pack(side="left", padx=10)
+
+        # Optional second pass over unmatched names (typos, hyphens, JR/III suffixes)
+        self.fuzzy_match = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(btn_frame, text="Fuzzy names", variable=self.fuzzy_match).pack(side="left", padx=10)
+
         self.spinner_label = ctk.CTkLabel(self.main_frame, text="")
 
         # Help label at bottom-left
@@ -251,51 +300,108 @@ class TableauApp(tb.Window):
         help_win.mainloop()
 
 
-    def start_spinner(self):
-        self.spinner_label.place(relx=0.71, rely=0.14, anchor="center")
-        gif_path = os.path.join(os.path.dirname(__file__), "public", "spinner.gif")
+    def load_spinner_frames(self):
+        # Decoded once; every later spinner reuses the same images
+        if self.spinner_frames is None:
+            from PIL import Image, ImageSequence
 
-        try:
-            pil_image = Image.open(gif_path)
-            self.spinner_frames = [
-                CTkImage(light_image=frame.convert("RGBA").copy(), size=(25, 25))
-                for frame in ImageSequence.Iterator(pil_image)
-            ]
+            gif_path = os.path.join(os.path.dirname(__file__), "public", "spinner.gif")
+            try:
+                with Image.open(gif_path) as pil_image:
+                    self.spinner_frames = [
+                        CTkImage(light_image=frame.convert("RGBA").copy(), size=(25, 25))
+                        for frame in ImageSequence.Iterator(pil_image)
+                    ]
+            except FileNotFoundError:
+                print(f"[ERROR] Spinner GIF not found at: {gif_path}")
+                self.spinner_frames = []
+        return self.spinner_frames
 
-            self.spinner_index = 0
-            self.spinner_running = True
-            self.spinner_label.configure(image=self.spinner_frames[0])
+    def start_spinner(self):
+        self.spinner_label.place(relx=0.71, rely=0.14, anchor="center")
+        frames = self.load_spinner_frames()
+        if not frames or self.spinner_job is not None:
+            return
 
-            def animate():
-                if self.spinner_running:
-                    self.spinner_index = (self.spinner_index + 1) % len(self.spinner_frames)
-                    self.spinner_label.configure(image=self.spinner_frames[self.spinner_index])
-                    self.after(50, animate)
+        self.spinner_index = 0
+        self.spinner_label.configure(image=frames[0])
 
-            animate()
+        def animate():
+            self.spinner_index = (self.spinner_index + 1) % len(frames)
+            self.spinner_label.configure(image=frames[self.spinner_index])
+            self.spinner_job = self.after(50, animate)
 
-        except FileNotFoundError:
-            print(f"[ERROR] Spinner GIF not found at: {gif_path}")
+        self.spinner_job = self.after(50, animate)
 
     def stop_spinner(self):
-        self.spinner_running = False
+        if self.spinner_job is not None:
+            self.after_cancel(self.spinner_job)
+            self.spinner_job = None
         self.spinner_label.place_forget()
 
     def clear_error(self, event=None):
         self.error_label.configure(text="")
 
     def append_output(self, text):
-        self.output_text.after(0, lambda: self._safe_insert_output(text))
+        self.log.write(text)
 
-    def _safe_insert_output(self, text):
+    def _clear_output(self):
+        self.log.clear()
         self.output_text.configure(state="normal")
-        self.output_text.insert("end", text)
+        self.output_text.delete("1.0", "end")
         self.output_text.configure(state="disabled")
 
     def update_progress(self, val):
         self.progress.after(0, lambda: self.progress.set(val))
 
-    def fetch_tableau_data(self, date):
+    def set_stage(self, run, stage, status):
+        self.after(0, lambda: self._stage_changed(run, stage, status))
+
+    def _stage_changed(self, run, stage, status):
+        # Results from an earlier upload are ignored
+        if run != self.upload_run:
+            return
+        self.stages[stage] = status
+        self.stage_label.configure(text=f"Tableau: {self.stages.get('fetch', '-')}    |    Upload: {self.stages.get('parse', '-')}")
+        ready = self.stages.get("fetch") == "ready" and self.stages.get("parse") == "ready"
+        if ready and self.auto_process.get() and not self.stages.get("auto_started"):
+            self.stages["auto_started"] = True
+            self.append_output("\nFetch and upload ready, processing...\n")
+            self.start_processing()
+
+    def parse_upload(self, run, file_path, tracer):
+        """ Parse the whole upload while Tableau is fetching; process_file reuses the cached frame """
+        if self.site_choice.get() == "Concord" and os.path.splitext(file_path)[1].lower() == ".csv":
+            # Read in chunks while processing; a full frame here would be parsed twice and held in memory
+            self.append_output("Upload will be read in chunks while processing.\n")
+            self._stage_changed(run, "parse", "ready")
+            return
+
+        def worker():
+            from upload_loader import load_upload
+
+            self.set_stage(run, "parse", "parsing...")
+            try:
+                with tracer.stage("parse upload") as span:
+                    df = load_upload(file_path)
+                    span.rows = len(df)
+                self.append_output(f"Upload parsed ({len(df):,} rows).\n")
+                self.set_stage(run, "parse", "ready")
+            except Exception as e:
+                self.append_output(f"[ERROR] Could not read upload: {e}\n")
+                self.set_stage(run, "parse", "failed")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _tableau_fetched(self, run, df, encounter_lookup):
+        # A fetch for an earlier upload must not replace the data of the current one
+        if run != self.upload_run:
+            return
+        self.df_tableau = df
+        self.encounter_lookup = encounter_lookup
+        self.append_output("Fetch complete.\n")
+
+    def fetch_tableau_data(self, run, date, tracer):
         self.progress.set(0)
         self.upload_btn.configure(state="disabled")
 
@@ -309,20 +415,26 @@ class TableauApp(tb.Window):
         else:
             messagebox.showwarning("Site Required", "Please select a site before fetching.")
             self.upload_btn.configure(state="normal")
+            self.stop_spinner()
+            self._stage_changed(run, "fetch", "no site")
             return
 
+        self._stage_changed(run, "fetch", "fetching...")
+
         def worker():
+            status = "failed"
             try:
-                df = self.fetcher.fetch_data(license_key, filter_values=date)
+                df = self.fetcher.fetch_data(license_key, filter_values=date, tracer=tracer)
                 if df is not None:
-                    self.df_tableau = df
-                    self.encounter_lookup = self.fetcher.encounter_lookup
-                    self.append_output("Fetch complete.\n")
+                    status = "ready"
+                    encounter_lookup = self.fetcher.encounter_lookup
+                    self.after(0, lambda: self._tableau_fetched(run, df, encounter_lookup))
                 else:
                     self.append_output("Fetch failed.\n")
             finally:
                 self.upload_btn.configure(state="normal")
                 self.after(0, self.stop_spinner)
+                self.set_stage(run, "fetch", status)
 
         threading.Thread(target=worker, daemon=True).start()
 
@@ -352,12 +464,24 @@ class TableauApp(tb.Window):
         if not self.uploaded_file_path:
             return
 
+        self.upload_run += 1
+        run = self.upload_run
+        self.stages = {}
+        self.df_tableau = None
+        self._clear_output()
+        # One trace per upload, covering the DOS scan, fetch, parse and processing
+        if self.tracer:
+            self.tracer.close()
+        self.tracer = tracer = Tracer(os.path.basename(self.uploaded_file_path))
+        self.parse_upload(run, self.uploaded_file_path, tracer)
+
         def worker():
             try:
-                self.output_text.delete("1.0", "end")
                 self.append_output("Connecting to Tableau...\n")
                 self.after(0, self.start_spinner)
-                date = get_oldest_dos(self.uploaded_file_path)
+                from oldest_dos import get_oldest_dos
+
+                date = get_oldest_dos(self.uploaded_file_path, tracer=tracer)
             except Exception as e:
                 error_message = f"Error: {str(e)}"
                 if "columns expected but not found: ['Date of Service']" in error_message:
@@ -366,11 +490,44 @@ class TableauApp(tb.Window):
                     self.after(0, lambda: self.append_output(f"[ERROR] {error_message}" + "\n"))
                 self.after(0, self.stop_spinner)
                 return
-            self.after(0, lambda: self.fetch_tableau_data(date))
+            self.after(0, lambda: self.fetch_tableau_data(run, date, tracer))
 
         threading.Thread(target=worker, daemon=True).start()
 
+    def choose_previous_output(self):
+        # Re-check only new, changed or unmatched rows against yesterday's PROCESSED file; cancel to clear
+        path = filedialog.askopenfilename(
+            title="Select Previous PROCESSED File",
+            filetypes=[
+                ("Processed files", ("*.xlsx", "*.csv", "*.parquet")),
+                ("All files",   ("*.*",)),
+            ]
+        )
+        self.previous_output = path or None
+        if self.previous_output:
+            self.previous_btn.configure(text=f"Previous: {os.path.basename(path)[:18]}")
+            self.append_output(f"Incremental mode: comparing with {path}\n")
+        else:
+            self.previous_btn.configure(text="Previous Output...")
+
+    def report_trace(self, tracer):
+        tracer.close()
+        try:
+            path = tracer.write()
+        except OSError as e:
+            path = None
+            self.append_output(f"[WARN] Could not write trace: {e}\n")
+        self.append_output("\n" + tracer.summary())
+        if path:
+            self.append_output(f"Trace saved: {path}\n")
+
     def process_file(self, license_key):
+        if self.stages.get("fetch") in ("fetching...", None) and self.uploaded_file_path:
+            messagebox.showwarning(
+                "Data Missing",
+                "Tableau data is still loading. Processing will be available once the fetch completes."
+            )
+            return
         if(license_key != ""):
             if self.encounter_lookup is None:
                 messagebox.showwarning(
@@ -388,8 +545,15 @@ class TableauApp(tb.Window):
             return
         
         self.after(0, self.start_spinner)
+        # Processing after an upload joins that upload's trace; a re-run gets its own
+        tracer, self.tracer = self.tracer or Tracer(os.path.basename(file_path)), None
+        fuzzy = self.fuzzy_match.get()
 
         def worker():
+            from process_elite_and_larkin import process_excel_file
+            from process_concord import process_concord
+
+            processed_path = None
             try:
                 if(license_key != ""):
                     processed_path = process_excel_file(
@@ -399,12 +563,17 @@ class TableauApp(tb.Window):
                         df_tableau=self.df_tableau,
                         output_callback=self.append_output,
                         tableau_fetcher=self.fetcher,
+                        tracer=tracer,
+                        previous_output=self.previous_output,
+                        fuzzy=fuzzy,
                     )
                 else:
                     self.append_output("\nProcessing data...\n")
-                    processed_path = process_concord(self.df_tableau, file_path)
+                    processed_path = process_concord(self.df_tableau, file_path, output_callback=self.append_output, chunksize=CONCORD_CHUNKSIZE, tracer=tracer,
+                                                     previous_output=self.previous_output, fuzzy=fuzzy)
             finally:
                 self.after(0, self.stop_spinner)
+                self.report_trace(tracer)
                 if processed_path:
                         self.append_output("\nDone processing!\n")
                         if messagebox.askyesno(
@@ -0,0 +1,221 @@
+"""
+Headless batch mode: reconcile many uploads in one run.
+
+    python batch.py manifest.csv --username me --workers 4
+
+The manifest is a CSV or JSON list with `file` and `client` (Larkin, Elite or Concord)
+per upload, and optionally `previous`, the last PROCESSED output for that file, to only
+re-check new, changed or unmatched rows. Each client's Tableau extract is fetched once, covering the oldest DOS of
+all its files, and the files are then processed in parallel. A JSON report with one
+entry per file is written at the end. The password is read from TABLEAU_PASSWORD or
+prompted for.
+"""
+import argparse
+import getpass
+import json
+import os
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from types import SimpleNamespace
+import pandas as pd
+from client_rules import CLIENT_LICENSE_KEYS
+from instrumentation import Tracer
+from oldest_dos import get_oldest_dos
+
+# Per worker process: extract path -> (df_tableau, encounter_lookup, patient_info_lookup).
+# Elite/Larkin only keep the lookups; Concord only keeps the frame.
+_extracts = {}
+
+
+def read_manifest(path):
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            entries = json.load(f)
+    else:
+        entries = pd.read_csv(path, dtype=str).fillna("").to_dict("records")
+
+    base = os.path.dirname(os.path.abspath(path))
+    manifest = []
+    for entry in entries:
+        client = entry["client"].strip().title()
+        if client not in CLIENT_LICENSE_KEYS:
+            raise ValueError(f"Unknown client '{entry['client']}' for {entry['file']}")
+        previous = (entry.get("previous") or "").strip()
+        manifest.append({
+            "file": os.path.join(base, entry["file"]),
+            "client": client,
+            "previous": os.path.join(base, previous) if previous else None,
+        })
+    return manifest
+
+
+def _load_extract(extract_path, license_key):
+    if extract_path not in _extracts:
+        df_tableau = pd.read_pickle(extract_path)
+        if license_key != "":
+            from lookups import build_lookups
+
+            # process_excel_file matches on the lookups' frames, so the extract itself is not kept
+            _extracts[extract_path] = (None, *build_lookups(df_tableau))
+        else:
+            _extracts[extract_path] = (df_tableau, None, None)
+    return _extracts[extract_path]
+
+
+def process_one(task):
+    """ Reconcile one upload in a worker process; returns its report entry """
+    from process_concord import process_concord
+    from process_elite_and_larkin import process_excel_file
+
+    messages = []
+    start = time.perf_counter()
+    entry = {"file": task["file"], "client": task["client"], "status": "failed", "output": None}
+    tracer = Tracer(f"{task['client']}_{os.path.basename(task['file'])}")
+    try:
+        license_key = CLIENT_LICENSE_KEYS[task["client"]]
+        df_tableau, encounter_lookup, patient_info_lookup = _load_extract(task["extract"], license_key)
+        if license_key != "":
+            output = process_excel_file(
+                task["file"],
+                license_key,
+                encounter_lookup=encounter_lookup,
+                df_tableau=df_tableau,
+                tableau_fetcher=SimpleNamespace(patient_info_lookup=patient_info_lookup),
+                output_callback=messages.append,
+                output_format=task["output_format"],
+                summary=task["summary"],
+                tracer=tracer,
+                previous_output=task["previous"],
+                fuzzy=task["fuzzy"],
+            )
+        else:
+            output = process_concord(
+                df_tableau,
+                task["file"],
+                output_format=task["output_format"],
+                output_callback=messages.append,
+                chunksize=task["chunksize"],
+                tracer=tracer,
+                previous_output=task["previous"],
+                fuzzy=task["fuzzy"],
+            )
+        if output:
+            entry.update(status="ok", output=str(output))
+    except Exception:
+        messages.append(traceback.format_exc())
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    tracer.close()
+    entry["trace"] = tracer.write()
+    entry["messages"] = "".join(messages)
+    return entry
+
+
+def fetch_extracts(manifest, args, password, workdir):
+    """ One Tableau fetch per client, covering the oldest DOS across that client's files """
+    from tableau_cache import TableauCache
+    from tableau_fetch import TableauFetcher
+
+    try:
+        cache = TableauCache()
+    except ImportError:
+        cache = None
+    fetcher = TableauFetcher(
+        args.username, password,
+        window_days=args.window_days, max_workers=args.fetch_workers, cache=cache,
+    )
+
+    fetches = {}
+    for client in sorted({entry["client"] for entry in manifest}):
+        files = [entry["file"] for entry in manifest if entry["client"] == client]
+        report = {"client": client, "files": len(files), "status": "failed", "extract": None}
+        start = time.perf_counter()
+        tracer = Tracer(f"{client}_fetch")
+        try:
+            dates = [d for d in (get_oldest_dos(f, tracer=tracer) for f in files) if d]
+            if not dates:
+                raise ValueError("No Date of Service values in any file")
+            oldest = min(dates, key=lambda d: datetime.strptime(d, "%m/%d/%Y"))
+            report["oldest_dos"] = oldest
+
+            df = fetcher.fetch_data(CLIENT_LICENSE_KEYS[client], oldest, tracer=tracer)
+            if df is None:
+                raise ValueError("No rows returned from Tableau")
+            extract = os.path.join(workdir, f"{client}.pkl")
+            df.to_pickle(extract)
+            report.update(status="ok", extract=extract, rows=len(df))
+        except Exception as e:
+            report["error"] = str(e)
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        tracer.close()
+        report["trace"] = tracer.write()
+        fetches[client] = report
+        print(f"\n{client}: {report['status']} ({report.get('rows', 0)} Tableau rows, {report['seconds']}s)")
+    return fetches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile a manifest of uploads without the GUI")
+    parser.add_argument("manifest", help="CSV or JSON with file and client per upload")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--fetch-workers", type=int, default=4)
+    parser.add_argument("--window-days", type=int, default=7)
+    parser.add_argument("--output-format", choices=["xlsx", "csv", "parquet"])
+    parser.add_argument("--summary", action="store_true", help="Add status counts to Elite/Larkin outputs")
+    parser.add_argument("--fuzzy", action="store_true", help="Match unmatched names by similarity and add a Match Confidence column")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Rows per chunk for Concord CSV uploads")
+    parser.add_argument("--report", help="Run report path (default batch_report_<time>.json)")
+    args = parser.parse_args()
+
+    password = os.environ.get("TABLEAU_PASSWORD") or getpass.getpass("Tableau password: ")
+    manifest = read_manifest(args.manifest)
+    started_at = datetime.now()
+    report_path = args.report or f"batch_report_{started_at:%Y%m%d_%H%M%S}.json"
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        fetches = fetch_extracts(manifest, args, password, workdir)
+
+        results = []
+        tasks = []
+        for entry in manifest:
+            fetch = fetches[entry["client"]]
+            if fetch["status"] != "ok":
+                results.append({**entry, "status": "failed", "output": None, "messages": f"Tableau fetch failed: {fetch.get('error')}"})
+                continue
+            tasks.append({
+                **entry,
+                "extract": fetch["extract"],
+                # Elite/Larkin keep their xlsx default; Concord keeps the upload's format
+                "output_format": args.output_format or ("xlsx" if CLIENT_LICENSE_KEYS[entry["client"]] else None),
+                "summary": args.summary,
+                "chunksize": args.chunksize,
+                "fuzzy": args.fuzzy,
+            })
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(process_one, task) for task in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"[{result['status']}] {result['client']}: {result['file']} ({result['seconds']}s)")
+
+    report = {
+        "started": started_at.isoformat(timespec="seconds"),
+        "seconds": round(time.perf_counter() - started, 3),
+        "fetches": [{k: v for k, v in f.items() if k != "extract"} for f in fetches.values()],
+        "files": results,
+    }
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    failed = sum(r["status"] != "ok" for r in results)
+    print(f"\n{len(results) - failed} of {len(results)} files processed. Report: {report_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
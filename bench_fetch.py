@@ -0,0 +1,70 @@
+"""
+Offline fetch-path benchmark against tableau_standin.py.
+
+    python bench_fetch.py --days 90 --rows-per-day 2000 --latency 0.3
+"""
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from tableau_cache import TableauCache
+from tableau_fetch import TableauFetcher
+from tableau_standin import CensusSource, StandinServer
+
+
+def run(label, fetcher, license_key, oldest_dos, server):
+    before = dict(server.counts)
+    start = time.perf_counter()
+    df = fetcher.fetch_data(license_key, oldest_dos)
+    elapsed = time.perf_counter() - start
+    downloads = server.counts["csv_downloads"] - before["csv_downloads"]
+    rows = 0 if df is None else len(df)
+    print(f"{label:<28} {elapsed:8.2f}s  {rows:>9} rows  {downloads:>4} downloads")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TableauFetcher against the local stand-in")
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--rows-per-day", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--bandwidth", type=float, help="CSV bytes per second")
+    parser.add_argument("--replay", help="Recorded census CSV to serve")
+    parser.add_argument("--license-key", default="160214")
+    parser.add_argument("--window-days", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    server = StandinServer(
+        source=CensusSource(args.replay, args.rows_per_day),
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+    ).start()
+    oldest = datetime.today() - timedelta(days=args.days)
+    oldest_dos = f"{oldest.month}/{oldest.day}/{oldest.year}"
+
+    def fetcher(**kwargs):
+        return TableauFetcher("bench", "bench", output_callback=lambda text: None,
+                              server_url=server.url, **kwargs)
+
+    run("single request", fetcher(), args.license_key, oldest_dos, server)
+    run(f"windowed ({args.window_days}d x {args.workers})",
+        fetcher(window_days=args.window_days, max_workers=args.workers), args.license_key, oldest_dos, server)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Fresh fetchers without the session LRU, so the warm run is served by the Parquet cache
+        def cached():
+            return fetcher(window_days=args.window_days, max_workers=args.workers, cache=TableauCache(cache_dir), lru_max_mb=0)
+
+        run("windowed, cold cache", cached(), args.license_key, oldest_dos, server)
+        run("windowed, warm cache", cached(), args.license_key, oldest_dos, server)
+
+        session = fetcher(window_days=args.window_days, max_workers=args.workers, cache=TableauCache(cache_dir))
+        session.fetch_data(args.license_key, oldest_dos)
+        run("session LRU hit", session, args.license_key, oldest_dos, server)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark for the desktop app.
+
+    python bench_startup.py --runs 5 --budget 1.5
+    python bench_startup.py --window
+
+Each measurement runs in a fresh interpreter. Importing app.py must not pull in the
+pandas / Tableau stack (that is warm_imports' job, after the login window paints), so
+the run fails if any of HEAVY_MODULES were loaded, or if --budget is exceeded.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ["pandas", "numpy", "tableauserverclient", "pyarrow", "openpyxl", "xlsxwriter"]
+
+IMPORT_APP = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in HEAVY if m in sys.modules]}))
+"""
+
+WARM_IMPORTS = """
+import json, time
+import app
+start = time.perf_counter()
+app.warm_imports()
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+# Time from interpreter start until the login window has been drawn
+FIRST_PAINT = """
+import json, time
+start = time.perf_counter()
+import app
+window = app.TableauApp()
+window.update()
+elapsed = time.perf_counter() - start
+window.destroy()
+print(json.dumps({"seconds": elapsed}))
+"""
+
+
+def measure(code, runs):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", f"HEAVY = {HEAVY_MODULES!r}\n{code}"],
+            cwd=HERE, capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def report(label, results):
+    seconds = [r["seconds"] for r in results]
+    print(f"{label:<24} median {statistics.median(seconds):7.3f}s   min {min(seconds):7.3f}s   max {max(seconds):7.3f}s")
+    return statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long the app takes to start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, help="Fail if importing app.py takes longer (median seconds)")
+    parser.add_argument("--window", action="store_true", help="Also time the first paint of the login window (needs a display)")
+    args = parser.parse_args()
+
+    imports = measure(IMPORT_APP, args.runs)
+    median = report("import app", imports)
+    report("warm_imports()", measure(WARM_IMPORTS, args.runs))
+    if args.window:
+        report("login window painted", measure(FIRST_PAINT, args.runs))
+
+    failed = False
+    loaded = sorted({m for r in imports for m in r["loaded"]})
+    if loaded:
+        print(f"FAIL: importing app.py loaded {', '.join(loaded)}")
+        failed = True
+    if args.budget is not None and median > args.budget:
+        print(f"FAIL: import app median {median:.3f}s is over the {args.budget:.3f}s budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
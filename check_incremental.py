@@ -0,0 +1,137 @@
+"""
+Incremental re-run check on synthetic data.
+
+    python check_incremental.py --rows 2000 --format xlsx
+    python check_incremental.py --fuzzy
+
+Each client's upload is processed once in full, then again against that output with the
+upload unchanged. Every row of the second run has to come back UNCHANGED or RECHECKED;
+anything NEW or CHANGED means the previous output no longer reads back like the upload.
+Rows without any ID value can never be paired and are always NEW.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from incremental import CHANGE_COLUMN, NEW, RECHECKED, UNCHANGED, read_output
+from lookups import build_lookups
+from process_concord import ID_COLUMNS as CONCORD_IDS, process_concord
+from process_elite_and_larkin import ID_COLUMNS as EXCEL_IDS, process_excel_file
+from tableau_standin import synthetic_day
+
+DAYS = 10
+
+
+def tableau_extract(rows_per_day, seed):
+    start = date(2024, 1, 1)
+    return pd.concat([synthetic_day(start + timedelta(days=i), rows_per_day, seed) for i in range(DAYS)], ignore_index=True)
+
+
+def _ids(rng, rows):
+    # Numeric IDs with a few blanks, which spreadsheets load as floats
+    ids = pd.Series(rng.integers(100_000, 999_999_999, rows), dtype=float)
+    ids[rng.random(rows) < 0.05] = np.nan
+    return ids
+
+
+def _typos(last):
+    # Two neighbouring letters of the surname swapped, as the fuzzy pass would see them
+    at = min(len(last) - 2, 2)
+    return last if at < 0 else last[:at] + last[at + 1] + last[at] + last[at + 2:]
+
+
+def excel_upload(tableau, rows, seed):
+    """ Elite/Larkin upload: Tableau names and DOS, misspelled surnames, and names Tableau has never seen """
+    rng = np.random.default_rng(seed)
+    picked = tableau.iloc[rng.integers(0, len(tableau), rows)]
+    last = picked['Last Name'].to_numpy(dtype=object)
+    typo = rng.random(rows) < 0.1
+    last[typo] = [_typos(name) for name in last[typo]]
+    names = last + ', ' + picked['FirstName'].to_numpy(dtype=object)
+    names[rng.random(rows) < 0.1] = 'NOBODY, SOMEONE'
+    return pd.DataFrame({
+        'Date of Service': pd.to_datetime(picked['DOS'], format='%m/%d/%Y').to_numpy(),
+        'Patient Name': names,
+        'Facility': picked['Facility Name'].to_numpy(),
+        'Patient Account #': _ids(rng, rows),
+    })
+
+
+def concord_upload(tableau, rows, seed):
+    rng = np.random.default_rng(seed)
+    picked = tableau.iloc[rng.integers(0, len(tableau), rows)]
+    return pd.DataFrame({
+        'Patient Name': (picked['Last Name'] + ', ' + picked['FirstName']).to_numpy(),
+        'Date of Service': picked['DOS'].to_numpy(),
+        'Account Number': _ids(rng, rows),
+        'Medical Record Number': _ids(rng, rows),
+        'Location Code': rng.choice(['CMG_ADVHMA', 'CMG_BREMH', 'CMG_WDLN'], rows),
+        'Department Code': rng.choice(['ED', 'URGENTCARE'], rows),
+    })
+
+
+def write_upload(df, path):
+    if path.endswith('.csv'):
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+
+def excel_client(license_key, fuzzy):
+    def process(path, tableau, previous_output=None):
+        encounter_lookup, patient_info_lookup = build_lookups(tableau)
+        return process_excel_file(
+            path, license_key, encounter_lookup=encounter_lookup, df_tableau=tableau.copy(),
+            tableau_fetcher=SimpleNamespace(patient_info_lookup=patient_info_lookup),
+            output_callback=lambda text: None, output_format=os.path.splitext(path)[1][1:],
+            previous_output=previous_output, fuzzy=fuzzy,
+        )
+    return process
+
+
+def concord_client(fuzzy):
+    def process(path, tableau, previous_output=None):
+        return process_concord(tableau, path, output_callback=lambda text: None, previous_output=previous_output, fuzzy=fuzzy)
+    return process
+
+
+def check(label, process, id_columns, upload, tableau, path):
+    write_upload(upload, path)
+    first = str(process(path, tableau))
+    previous = os.path.join(os.path.dirname(path), 'previous_' + os.path.basename(first))
+    os.replace(first, previous)
+    output = read_output(str(process(path, tableau, previous_output=previous)))
+    labels = output[CHANGE_COLUMN]
+    no_id = output[id_columns].fillna('').eq('').all(axis=1)
+    counts = labels.value_counts().to_dict()
+    ok = (labels.isin([UNCHANGED, RECHECKED]) | (no_id & (labels == NEW))).all()
+    print(f"{label:<10} {len(labels):>7} rows  {counts}  {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that an unchanged upload re-runs as UNCHANGED/RECHECKED")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="xlsx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fuzzy", action="store_true", help="Run both passes with fuzzy name matching")
+    args = parser.parse_args()
+
+    tableau = tableau_extract(max(args.rows // DAYS, 1), args.seed)
+    ok = True
+    with tempfile.TemporaryDirectory() as folder:
+        for label, license_key in (("Elite", "160214"), ("Larkin", "137797")):
+            upload = excel_upload(tableau, args.rows, args.seed + 1)
+            path = os.path.join(folder, f"{label}.{args.format}")
+            ok &= check(label, excel_client(license_key, args.fuzzy), EXCEL_IDS, upload, tableau, path)
+        path = os.path.join(folder, f"Concord.{args.format}")
+        ok &= check("Concord", concord_client(args.fuzzy), CONCORD_IDS, concord_upload(tableau, args.rows, args.seed + 2), tableau, path)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
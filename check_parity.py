@@ -0,0 +1,253 @@
+"""
+Parity check of the column-wise lookups and matching against the original row loops.
+
+    python check_parity.py --rows 2000 --seeds 3
+
+The baseline_* functions are the pre-vectorization code (per-row Tableau loop, nested
+encounter dicts, merge-based Elite/Larkin match, iterrows Concord match), kept here as the
+reference. Both sides get the same synthetic_day extract: the baseline as fetched text,
+the current code typed by schema.tableau_frame like the app's session copy. Outputs are
+compared cell by cell as they read back from the written files.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from collections import defaultdict
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from check_incremental import concord_upload, excel_upload, tableau_extract, write_upload
+from lookups import build_lookups
+from process_concord import process_concord
+from process_elite_and_larkin import process_excel_file
+from schema import tableau_frame
+
+
+def baseline_lookups(df):
+    """ encounter_lookup / patient_info_lookup as TableauFetcher built them row by row """
+    encounter_lookup = defaultdict(lambda: defaultdict(list))
+    patient_info_lookup = {}
+    for _, row in df.iterrows():
+        last = str(row['Last Name']).strip().upper()
+        first = str(row['FirstName']).strip().upper()
+        code = str(row['Charge Code']).strip().upper()
+        dos = str(row['DOS']).strip()
+        appointment_num = str(row['Appointment FID']).strip()
+        dob = str(row['DOB']).strip()
+        mrn = str(row['Chart Number']).strip()
+        provider = str(row.get('Provider', '')).strip()
+        if (last, first) not in patient_info_lookup:
+            patient_info_lookup[(last, first)] = {"dob": dob, "mrn": mrn}
+        if (code, dos) not in [(c, d) for c, d, _ in encounter_lookup[(last, first)][appointment_num]]:
+            encounter_lookup[(last, first)][appointment_num].append((code, dos, provider))
+    return encounter_lookup, patient_info_lookup
+
+
+def baseline_excel(df, license_key, encounter_lookup, patient_info_lookup):
+    """ process_excel_file's frame before the column-wise match table and rule tables """
+    df["Date of Service"] = pd.to_datetime(df["Date of Service"], errors="coerce")
+    names = df['Patient Name'].astype(str).str.split(',', n=1, expand=True)
+    df['Last Name'] = names[0].str.strip().str.upper()
+    df['First Name'] = names[1].str.strip().str.upper().fillna("")
+    df['FirstKey'] = df['First Name'].str.split().str[0]
+    for col in ['Provider', 'Patient MRN', 'Patient DOB', 'ID1', 'ID2', 'ID3', 'Census Reconciliation', 'UNBILLED', 'E&M (Pro)', 'Status']:
+        if col not in df.columns:
+            df[col] = ""
+    df['DosNormalize'] = df['Date of Service'].dt.normalize()
+
+    enc_rows = []
+    for (last, first), appts in encounter_lookup.items():
+        for entries in appts.values():
+            for code, dos_str, provider in entries:
+                enc_rows.append({
+                    'Last Name': last, 'FirstKey': first.upper().split()[0],
+                    'DosLookup': pd.to_datetime(dos_str, format='%m/%d/%Y', errors='coerce').normalize(),
+                    'Code': code, 'ProviderLookup': provider,
+                })
+    enc_df = pd.DataFrame(enc_rows)
+    enc_df['is_99'] = enc_df['Code'].str.startswith('99', na=False)
+    enc_df = enc_df.sort_values(['Last Name', 'FirstKey', 'DosLookup', 'is_99'], ascending=[True, True, True, False])
+    enc_df = enc_df.drop_duplicates(subset=['Last Name', 'FirstKey', 'DosLookup'], keep='first').drop(columns='is_99')
+    df = df.merge(enc_df, left_on=['Last Name', 'FirstKey', 'DosNormalize'],
+                  right_on=['Last Name', 'FirstKey', 'DosLookup'], how='left')
+    df['Provider'] = df['ProviderLookup'].fillna("")
+
+    tableau_keys = set(encounter_lookup.keys())
+    name_exists = pd.Series(list(zip(df['Last Name'], df['FirstKey']))).isin(tableau_keys)
+    if license_key == '160214':
+        billed = df['Code'].str.startswith('99', na=False)
+        lwbs, ama, zero, null = (df['Code'] == 'LWBS'), (df['Code'] == 'AMA'), (df['Code'] == '0'), (df['Code'] == 'NULL')
+        df['use_code'] = np.select([lwbs, ama, zero, null, billed], ['LWBS', 'AMA', '0', 'NULL', df['Code']], default='')
+        df['Census Reconciliation'] = np.select([lwbs, ama, zero, null, billed], ['LWBS', 'AMA', 'NON ED ENCOUNTERS', '', 'BILLED'], default='#N/A')
+        df['Status'] = np.where(df['use_code'] == '', 'MISMATCH DOS', 'OPEN')
+        df.loc[billed & df['Census Reconciliation'].isin(['BILLED', 'LWBS', 'AMA']), 'Status'] = 'DE_COMPLETE'
+        df.loc[df['Code'].notna() & ~(lwbs | ama | zero | null | billed), 'Status'] = 'INVALID CODE IN TABLEAU'
+        df['E&M (Pro)'] = df['use_code']
+        df.loc[~name_exists, 'Status'] = 'NAME NOT FOUND IN TABLEAU'
+    else:
+        matched = df['Code'].notna()
+        df['Census Reconciliation'] = [
+            "" if stat == 'ABANDONED' else 'BILLED' if ex and m else 'MISMATCHED DOS' if ex else 'NAME NOT IN TABLEAU'
+            for stat, ex, m in zip(df['Status'].fillna('').astype(str), name_exists, matched)
+        ]
+        mrn_map, dob_map = {}, {}
+        for (last, first), info in patient_info_lookup.items():
+            mrn_map[(last.upper(), first.upper())] = info.get('mrn', '')
+            dob = pd.to_datetime(info.get('dob', ''), errors='coerce')
+            dob_map[(last.upper(), first.upper())] = dob.strftime('%m/%d/%Y') if pd.notnull(dob) else ""
+        keys = list(zip(df['Last Name'], df['FirstKey']))
+        df['Patient MRN'] = [mrn_map.get(k, "") for k in keys]
+        df['Patient DOB'] = [dob_map.get(k, "") for k in keys]
+
+    serial_dos = (df['Date of Service'].dt.normalize() - pd.Timestamp('1899-12-30')).dt.days.astype(str)
+    dob = pd.to_datetime(df['Patient DOB'], format='%m/%d/%Y', errors='coerce').dt.normalize()
+    serial_dob = (dob - pd.Timestamp('1899-12-30')).dt.days.astype(str)
+    df['ID1'] = df['Patient MRN'].astype(str) + serial_dos
+    df['ID2'] = serial_dos + serial_dob + df['Last Name']
+    df['ID3'] = ''
+
+    df = df.drop(columns=['DosNormalize', 'DosLookup', 'ProviderLookup', 'Code', 'use_code', 'FirstKey'], errors='ignore')
+    desired = [
+        'ID1', 'ID2', 'ID3', 'Date of Service', 'Date Billed', 'Facility', 'Patient Account #',
+        'Patient MRN', 'Patient DOB', 'Patient Name', 'Last Name', 'First Name',
+        'E&M (Fac)', 'E&M (Pro)', 'Status', 'Census Reconciliation', 'UNBILLED', 'Provider'
+    ]
+    return df[[c for c in desired if c in df.columns] + [c for c in df.columns if c not in desired]]
+
+
+def baseline_concord(df_tableau, df, exclusions):
+    """ process_concord's iterrows match over a name dict keyed by (last, first, DOS) and (last, first, MRN) """
+    for location, department in exclusions:
+        df = df[~((df['Location Code'] == location) & (df['Department Code'] == department))]
+    df_tableau = df_tableau.copy()
+    df_tableau['FirstName'] = df_tableau['FirstName'].astype(str).str.strip().str.upper().str.split().str[0]
+    df_tableau['Last Name'] = df_tableau['Last Name'].astype(str).str.strip()
+    df_tableau['DOS'] = pd.to_datetime(df_tableau['DOS'], errors='coerce')
+    df_tableau['Chart Number'] = df_tableau['Chart Number'].astype(str).str.strip()
+    name_lookup = {}
+    for _, row in df_tableau.iterrows():
+        name_lookup[(row['Last Name'], row['FirstName'], row['DOS'])] = row.to_dict()
+        name_lookup[(row['Last Name'], row['FirstName'], row['Chart Number'])] = row.to_dict()
+
+    for i, col in enumerate(['ID (DOS_ACCT)', 'ID2 (DOS_MRN)', 'ID3 (DOS_Patient Name)', 'Patient Name ', 'Facility', 'Carrier', 'Provider']):
+        df.insert(i, col, '')
+    df['Patient Name'] = df['Patient Name'].astype(str).str.strip()
+    df['Date of Service'] = df['Date of Service'].astype(str).str.strip()
+    for idx, row in df.iterrows():
+        try:
+            date_obj = pd.to_datetime(row['Date of Service'])
+            serial_date = str((date_obj - pd.Timestamp("1899-12-30")).days)
+            acct = ''.join(filter(str.isdigit, str(row.get('Account Number', '')).strip()))
+            mrn = ''.join(filter(str.isdigit, str(row.get('Medical Record Number', '')).strip()))
+            patient_name = str(row.get('Patient Name', '')).strip()
+            last_first = patient_name.split(',')
+            if len(last_first) != 2:
+                continue
+            last = last_first[0].strip().upper()
+            first = last_first[1].strip().upper().split()[0]
+            if acct:
+                df.at[idx, 'ID (DOS_ACCT)'] = serial_date + acct
+            if mrn:
+                df.at[idx, 'ID2 (DOS_MRN)'] = serial_date + mrn
+            if patient_name:
+                df.at[idx, 'ID3 (DOS_Patient Name)'] = serial_date + patient_name
+            match = name_lookup.get((last, first, date_obj)) or name_lookup.get((last, first, mrn))
+            for col, src in (('Patient Name ', 'Patient Name'), ('Provider', 'Provider'), ('Carrier', 'Carrier'), ('Facility', 'Facility Name')):
+                df.at[idx, col] = match.get(src, '') if match else '#N/A'
+        except Exception:
+            continue
+    return df
+
+
+def _read(path):
+    path = str(path)
+    return pd.read_csv(path, dtype=str) if path.endswith('.csv') else pd.read_excel(path, dtype=str)
+
+
+def _compare(label, expected, actual):
+    same = list(expected.columns) == list(actual.columns) and expected.equals(actual)
+    print(f"{label:<28} {len(actual):>7} rows  {'same' if same else 'DIFFERENT'}")
+    if not same and list(expected.columns) == list(actual.columns) and len(expected) == len(actual):
+        for col in expected.columns:
+            differs = ~((expected[col] == actual[col]) | (expected[col].isna() & actual[col].isna()))
+            if differs.any():
+                print(f"   {col}: {int(differs.sum())} cells, e.g. {expected[col][differs].iloc[0]!r} -> {actual[col][differs].iloc[0]!r}")
+    return same
+
+
+def check_lookups(tableau):
+    old_encounters, old_patients = baseline_lookups(tableau)
+    encounter_lookup, patient_info_lookup = build_lookups(tableau_frame(tableau))
+    same = (
+        list(old_encounters) == list(encounter_lookup)
+        and all(list(old_encounters[k].items()) == list(encounter_lookup[k].items()) for k in old_encounters)
+        and list(old_patients.items()) == [(k, patient_info_lookup[k]) for k in patient_info_lookup]
+    )
+    print(f"{'lookups':<28} {len(encounter_lookup):>7} names {'same' if same else 'DIFFERENT'}")
+    return same
+
+
+def check_excel(tableau, label, license_key, upload, folder):
+    path = os.path.join(folder, f"{label}.xlsx")
+    write_upload(upload, path)
+    old_encounters, old_patients = baseline_lookups(tableau)
+    expected = os.path.join(folder, f"expected_{label}.xlsx")
+    baseline_excel(pd.read_excel(path), license_key, old_encounters, old_patients).to_excel(expected, index=False)
+
+    typed = tableau_frame(tableau)
+    encounter_lookup, patient_info_lookup = build_lookups(typed)
+    messages = []
+    output = process_excel_file(path, license_key, encounter_lookup=encounter_lookup, df_tableau=typed,
+                                tableau_fetcher=SimpleNamespace(patient_info_lookup=patient_info_lookup),
+                                output_callback=messages.append)
+    if output is None:
+        print("".join(messages))
+        return False
+    return _compare(label, _read(expected), _read(output))
+
+
+def check_concord(tableau, upload, folder, fmt, chunksize):
+    from process_concord import load_exclusions
+
+    path = os.path.join(folder, f"Concord.{fmt}")
+    write_upload(upload, path)
+    exclusions = list(load_exclusions().itertuples(index=False, name=None))
+    source = pd.read_csv(path) if fmt == 'csv' else pd.read_excel(path)
+    expected = os.path.join(folder, f"expected_Concord.{fmt}")
+    result = baseline_concord(tableau, source, exclusions)
+    result.to_csv(expected, index=False) if fmt == 'csv' else result.to_excel(expected, index=False)
+
+    output = process_concord(tableau_frame(tableau), path, output_callback=lambda text: None, chunksize=chunksize)
+    label = f"Concord {fmt}" + (f", {chunksize}-row chunks" if chunksize else "")
+    return _compare(label, _read(expected), _read(output))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare current outputs with the original row-by-row logic")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--seeds", type=int, default=2)
+    args = parser.parse_args()
+
+    ok = True
+    for seed in range(args.seeds):
+        tableau = tableau_extract(max(args.rows // 10, 1), seed)
+        # A few blank providers and codes, as real extracts have
+        tableau.loc[tableau.index[::53], 'Provider'] = np.nan
+        tableau.loc[tableau.index[::71], 'Charge Code'] = np.nan
+        print(f"seed {seed}")
+        ok &= check_lookups(tableau)
+        with tempfile.TemporaryDirectory() as folder:
+            elite = excel_upload(tableau, args.rows, seed + 1)
+            ok &= check_excel(tableau, "Elite", "160214", elite, folder)
+            larkin = excel_upload(tableau, args.rows, seed + 2)
+            larkin['Status'] = np.random.default_rng(seed).choice(['ABANDONED', 'OPEN', None], len(larkin))
+            ok &= check_excel(tableau, "Larkin", "137797", larkin, folder)
+            upload = concord_upload(tableau, args.rows, seed + 3)
+            for fmt, chunksize in (("xlsx", None), ("csv", None), ("csv", 97)):
+                ok &= check_concord(tableau, upload, folder, fmt, chunksize)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
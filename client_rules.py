@@ -0,0 +1,150 @@
+from functools import lru_cache
+import numpy as np
+
+# Client names as shown in the app, and the Tableau license key each one filters on
+CLIENT_LICENSE_KEYS = {
+    'Larkin': '137797',
+    'Elite': '160214',
+    'Concord': '',
+}
+
+# Status logic per license key, as data. Each output column lists (when, value) rules in
+# precedence order; the first rule that matches a row sets its value, otherwise `default`.
+#
+# when:  {'code': class or [classes], 'name_found': bool, 'status': [existing Status values]}
+#        Code classes come from `code_classes` plus MATCHED (any Tableau code),
+#        UNMATCHED (no Tableau row for the DOS) and INVALID (a code outside every class).
+# value: a literal, or {'column': name} to copy another column
+CLIENT_RULES = {
+    # Elite
+    '160214': {
+        'code_classes': [
+            ('LWBS', {'equals': 'LWBS'}),
+            ('AMA', {'equals': 'AMA'}),
+            ('ZERO', {'equals': '0'}),
+            ('NULL', {'equals': 'NULL'}),
+            ('BILLED', {'prefix': '99'}),
+        ],
+        'columns': {
+            'Census Reconciliation': {
+                'rules': [
+                    ({'code': 'LWBS'}, 'LWBS'),
+                    ({'code': 'AMA'}, 'AMA'),
+                    ({'code': 'ZERO'}, 'NON ED ENCOUNTERS'),
+                    ({'code': 'NULL'}, ''),
+                    ({'code': 'BILLED'}, 'BILLED'),
+                ],
+                'default': '#N/A',
+            },
+            'Status': {
+                'rules': [
+                    ({'name_found': False}, 'NAME NOT FOUND IN TABLEAU'),
+                    ({'code': 'INVALID'}, 'INVALID CODE IN TABLEAU'),
+                    ({'code': 'BILLED'}, 'DE_COMPLETE'),
+                    ({'code': ['LWBS', 'AMA', 'ZERO', 'NULL']}, 'OPEN'),
+                ],
+                'default': 'MISMATCH DOS',
+            },
+            'E&M (Pro)': {
+                'rules': [
+                    ({'code': 'LWBS'}, 'LWBS'),
+                    ({'code': 'AMA'}, 'AMA'),
+                    ({'code': 'ZERO'}, '0'),
+                    ({'code': 'NULL'}, 'NULL'),
+                    ({'code': 'BILLED'}, {'column': 'Code'}),
+                ],
+                'default': '',
+            },
+        },
+    },
+    # Larkin
+    '137797': {
+        'code_classes': [],
+        'columns': {
+            'Census Reconciliation': {
+                'rules': [
+                    ({'status': ['ABANDONED']}, ''),
+                    ({'name_found': True, 'code': 'MATCHED'}, 'BILLED'),
+                    ({'name_found': True}, 'MISMATCHED DOS'),
+                ],
+                'default': 'NAME NOT IN TABLEAU',
+            },
+        },
+    },
+}
+
+
+class CompiledRules:
+    # Rule table resolved once into class/condition lookups, evaluated in one vectorized pass
+    def __init__(self, spec):
+        self.code_classes = spec.get('code_classes', [])
+        self.class_names = [name for name, _ in self.code_classes]
+        self.columns = [
+            (column, [(when, value) for when, value in table['rules']], table['default'])
+            for column, table in spec['columns'].items()
+        ]
+
+    def _classify(self, code):
+        # One class id per row: index into class_names, -1 for INVALID, -2 for UNMATCHED
+        conds = []
+        for _, match in self.code_classes:
+            if 'equals' in match:
+                conds.append((code == match['equals']).to_numpy())
+            else:
+                conds.append(code.str.startswith(match['prefix'], na=False).to_numpy())
+        unclassified = np.where(code.notna().to_numpy(), -1, -2)
+        if not conds:
+            return unclassified
+        return np.select(conds, list(range(len(conds))), default=unclassified)
+
+    def _class_mask(self, class_ids, names):
+        names = [names] if isinstance(names, str) else names
+        mask = np.zeros(len(class_ids), dtype=bool)
+        for name in names:
+            if name == 'MATCHED':
+                mask |= class_ids != -2
+            elif name == 'UNMATCHED':
+                mask |= class_ids == -2
+            elif name == 'INVALID':
+                mask |= class_ids == -1
+            else:
+                mask |= class_ids == self.class_names.index(name)
+        return mask
+
+    def evaluate(self, df, name_found):
+        """ Write every rule column onto df; name_found is a bool array per row """
+        class_ids = self._classify(df['Code'])
+        statuses = df['Status'].fillna('').astype(str).to_numpy() if 'Status' in df.columns else None
+        name_found = np.asarray(name_found, dtype=bool)
+
+        conditions = {}
+
+        def condition(when):
+            key = repr(sorted(when.items()))
+            if key not in conditions:
+                mask = np.ones(len(df), dtype=bool)
+                if 'code' in when:
+                    mask &= self._class_mask(class_ids, when['code'])
+                if 'name_found' in when:
+                    mask &= name_found if when['name_found'] else ~name_found
+                if 'status' in when:
+                    mask &= np.isin(statuses, when['status'])
+                conditions[key] = mask
+            return conditions[key]
+
+        results = {}
+        for column, rules, default in self.columns:
+            choices = [
+                df[value['column']].to_numpy(dtype=object) if isinstance(value, dict) else value
+                for _, value in rules
+            ]
+            results[column] = np.select([condition(when) for when, _ in rules], choices, default=default)
+
+        for column, values in results.items():
+            df[column] = values
+        return df
+
+
+@lru_cache(maxsize=None)
+def compile_rules(license_key):
+    return CompiledRules(CLIENT_RULES[license_key])
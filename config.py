@@ -0,0 +1,37 @@
+import os
+import sys
+
+# Override to point the app at another Tableau server, e.g. tableau_standin.py
+SERVER_URL = os.environ.get("TABLEAU_SERVER_URL", "https://tableau.blitzmedical.com")
+
+# Per-user data directory for anything the app keeps between runs
+APP_DIR = os.path.join(os.path.expanduser("~"), ".census_reconciliation")
+CACHE_DIR = os.path.join(APP_DIR, "tableau_cache")
+
+# Days are re-fetched until they were downloaded at least this long after the DOS
+CACHE_REFRESH_DAYS = 3
+
+# Non-Blitz (Location Code, Department Code) pairs dropped from Concord uploads
+CONCORD_EXCLUSIONS_PATH = os.environ.get(
+    "CONCORD_EXCLUSIONS_PATH",
+    os.path.join(getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__))), "concord_exclusions.json"),
+)
+
+# Write a .parquet copy next to each parsed upload so re-runs skip Excel parsing
+UPLOAD_SIDECARS = os.environ.get("CENSUS_UPLOAD_SIDECARS", "") == "1"
+
+# Per-run stage traces (JSONL plus a Chrome trace); peak memory only when asked for, tracemalloc slows runs 2-3x
+TRACE_DIR = os.path.join(APP_DIR, "traces")
+TRACE_MEMORY = os.environ.get("CENSUS_TRACE_MEMORY", "0") == "1"
+
+# Full copy of everything shown in the GUI output box
+LOG_DIR = os.path.join(APP_DIR, "logs")
+
+# In-memory extracts kept by TableauFetcher across uploads in one session
+EXTRACT_LRU_MAX_MB = int(os.environ.get("CENSUS_EXTRACT_LRU_MB", "512"))
+EXTRACT_LRU_MAX_AGE = 60 * 60
+
+# Lowest name similarity the optional fuzzy pass accepts, and how many days around the DOS it
+# looks for names Tableau does not know exactly
+FUZZY_THRESHOLD = float(os.environ.get("CENSUS_FUZZY_THRESHOLD", "0.85"))
+FUZZY_DOS_WINDOW_DAYS = 1
@@ -0,0 +1,165 @@
+"""
+Second matching pass for rows the exact (last, first) join left unmatched.
+
+Names are normalized (case, punctuation, hyphens, JR/SR/II/III suffixes) and blocked by
+Soundex code and DOS day, so each unmatched row is only scored against the few Tableau
+names that sound alike and were seen around the same DOS. Scores come from difflib.
+"""
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from config import FUZZY_THRESHOLD
+
+CONFIDENCE_COLUMN = 'Match Confidence'
+SUFFIXES = {'JR', 'SR', 'II', 'III', 'IV', 'V'}
+SOUNDEX_CODES = {
+    letter: digit
+    for digit, letters in (('1', 'BFPV'), ('2', 'CGJKQSXZ'), ('3', 'DT'), ('4', 'L'), ('5', 'MN'), ('6', 'R'))
+    for letter in letters
+}
+# Share of the score that comes from the last name; the rest is the first name
+LAST_WEIGHT = 0.6
+
+
+@lru_cache(maxsize=None)
+def soundex(word):
+    """ American Soundex code, e.g. ROBERT -> R163; '' for a word without letters """
+    word = re.sub(r'[^A-Z]', '', word.upper())
+    if not word:
+        return ''
+    code = word[0]
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for letter in word[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W do not separate letters with the same code; vowels do
+        if letter not in 'HW':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def name_parts(name):
+    """ Upper-case words of a name, without punctuation or generational suffixes """
+    words = re.sub(r"[^A-Z]+", " ", re.sub(r"['.]", "", str(name).upper())).split()
+    kept = [word for word in words if word not in SUFFIXES]
+    return tuple(kept or words)
+
+
+def _last_similarity(a, b, floor=0.0):
+    if ''.join(a) == ''.join(b):
+        return 1.0
+    # One half of a hyphenated or double surname
+    if set(a) <= set(b) or set(b) <= set(a):
+        return 0.95
+    matcher = SequenceMatcher(None, ' '.join(a), ' '.join(b))
+    # The quick ratios are upper bounds; skip the full comparison when they already fall short
+    if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+        return 0.0
+    return matcher.ratio()
+
+
+@lru_cache(maxsize=2**16)
+def _first_similarity(a, b):
+    return 1.0 if a == b else SequenceMatcher(None, a, b).ratio()
+
+
+def similarity(a, b, threshold=0.0):
+    """
+    Confidence in [0, 1] that two (last parts, first parts) names are the same patient.
+    Scores that cannot reach `threshold` may be returned as 0.
+    """
+    first = _first_similarity(''.join(a[1][:1]), ''.join(b[1][:1]))
+    floor = (threshold - (1 - LAST_WEIGHT) * first) / LAST_WEIGHT
+    if floor > 1:
+        return 0.0
+    return LAST_WEIGHT * _last_similarity(a[0], b[0], floor) + (1 - LAST_WEIGHT) * first
+
+
+def _normalized(last, first):
+    # One id per distinct (last, first) pair and its normalized name; each distinct string is parsed once
+    last_ids, last_values = pd.factorize(pd.Series(last, dtype=object).fillna(''))
+    first_ids, first_values = pd.factorize(pd.Series(first, dtype=object).fillna(''))
+    pair_ids, pairs = pd.factorize(last_ids.astype('int64') * (len(first_values) + 1) + first_ids)
+    last_parts = [name_parts(value) for value in last_values]
+    first_parts = [name_parts(value) for value in first_values]
+    names = [(last_parts[pair // (len(first_values) + 1)], first_parts[pair % (len(first_values) + 1)]) for pair in pairs]
+    return pair_ids, names
+
+
+def _block_codes(name):
+    # Soundex of each surname part and of the whole surname. The first name's code, paired with
+    # either end of the surname's code, also pairs surnames whose typo changed one of its ends.
+    last, first = name
+    codes = {'L' + soundex(part) for part in last} | {'L' + soundex(''.join(last))}
+    if first and last:
+        surname = soundex(''.join(last))
+        codes.add('F' + soundex(first[0]) + surname[1:])
+        codes.add('P' + soundex(first[0]) + surname[:2])
+    codes.discard('L')
+    return codes
+
+
+class FuzzyIndex:
+    """ Tableau names blocked by (phonetic code, DOS day); positions refer to the rows passed in """
+    def __init__(self, last, first, days, keep='first'):
+        days = np.asarray(days, dtype='int64')
+        pair_ids, self._names = _normalized(last, first)
+
+        # One entry per (name, day); `keep` picks which Tableau row it points at
+        entries = pd.DataFrame({'name': pair_ids, 'day': days, 'row': np.arange(len(days))})
+        entries = entries[entries['day'] >= 0].drop_duplicates(['name', 'day'], keep=keep)
+        self._entry_name = entries['name'].tolist()
+        self._entry_day = entries['day'].tolist()
+        self._entry_row = entries['row'].tolist()
+
+        codes = [_block_codes(name) for name in self._names]
+        self._blocks = {}
+        for entry, (name, day) in enumerate(zip(self._entry_name, self._entry_day)):
+            for code in codes[name]:
+                self._blocks.setdefault((code, day), []).append(entry)
+
+    def match(self, last, first, days, window=0, threshold=FUZZY_THRESHOLD):
+        """
+        Best Tableau row per query name within `window` days of its DOS, and its score.
+        Rows without a candidate at or above `threshold`, or with two different names tied
+        for the best score, get position -1 and a NaN score.
+        """
+        days = np.asarray(days, dtype='int64').tolist()
+        pair_ids, names = _normalized(last, first)
+        codes = [_block_codes(name) for name in names]
+        positions = np.full(len(days), -1)
+        scores = np.full(len(days), np.nan)
+        offsets = range(-window, window + 1)
+        scored = {}
+
+        for i, (query, day) in enumerate(zip(pair_ids.tolist(), days)):
+            name = names[query]
+            if day < 0 or not name[0]:
+                continue
+            candidates = set()
+            for code in codes[query]:
+                for offset in offsets:
+                    candidates.update(self._blocks.get((code, day + offset), ()))
+            if not candidates:
+                continue
+
+            ranked = []
+            for entry in candidates:
+                target = self._entry_name[entry]
+                if (query, target) not in scored:
+                    scored[(query, target)] = similarity(name, self._names[target], threshold)
+                # Higher score first, then the closest day, then the earliest Tableau row
+                ranked.append((scored[(query, target)], -abs(self._entry_day[entry] - day), -self._entry_row[entry], entry))
+            score, _, _, entry = max(ranked)
+            if score < threshold:
+                continue
+            if any(rank[0] == score and self._entry_name[rank[3]] != self._entry_name[entry] for rank in ranked):
+                continue
+            positions[i] = self._entry_row[entry]
+            scores[i] = round(score, 3)
+        return positions, scores
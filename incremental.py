@@ -0,0 +1,176 @@
+"""
+Incremental re-reconciliation against a previous PROCESSED output.
+
+Rows are matched to the previous file by their generated ID columns plus a fingerprint
+of their other columns, so a matched row has exactly the inputs it had last time. IDs
+that repeat are paired in order of appearance. A matched row keeps its previous results
+unless one of them was a no-match value; every other row is evaluated again.
+Tableau changes to rows that already matched are not picked up until a full run.
+"""
+import os
+from collections import Counter
+import numpy as np
+import pandas as pd
+from sheets import read_sheet
+
+# Results that mean "not matched yet"; rows showing any of them are always re-checked
+RECHECK_VALUES = {'#N/A', 'NAME NOT FOUND IN TABLEAU', 'MISMATCH DOS', 'NAME NOT IN TABLEAU', 'MISMATCHED DOS'}
+CHANGE_COLUMN = 'Change'
+NEW, CHANGED, RECHECKED, UNCHANGED = 'NEW', 'CHANGED', 'RECHECKED', 'UNCHANGED'
+
+
+def read_output(path):
+    # Read as text like the upload's IDs: '#N/A' is a result here, not a missing value, and
+    # Excel number cells must not come back as floats ("225177.0")
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        return pd.read_parquet(path)
+    if ext == ".csv":
+        return pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+    return read_sheet(path, dtype=str, keep_default_na=False, na_values=[''])
+
+
+def _keys(frame, id_columns):
+    # One string per row; empty IDs never match
+    parts = [frame[col].astype(str).fillna('').str.strip() for col in id_columns]
+    key = parts[0].str.cat(parts[1:], sep='\x1f') if len(parts) > 1 else parts[0]
+    empty = np.logical_and.reduce([(p == '') | (p == 'nan') for p in parts])
+    return key.to_numpy(dtype=object), empty
+
+
+def _kind(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return 'number'
+    return 'text'
+
+
+def _canonical(series, kind):
+    """ Column as text that reads the same from the upload and from a written output """
+    if kind == 'datetime':
+        return pd.to_datetime(series, errors='coerce', format='mixed').dt.strftime('%Y-%m-%d %H:%M:%S').fillna('')
+    if kind == 'number':
+        return pd.to_numeric(series, errors='coerce').astype(float).astype(str).replace('nan', '')
+    return series.astype(object).where(series.notna(), '').astype(str).str.strip()
+
+
+class Plan:
+    """ Which rows of one frame are evaluated again and which reuse previous results """
+    def __init__(self, labels, previous_rows):
+        self.labels = labels
+        self.previous_rows = previous_rows
+        self.reuse = labels == UNCHANGED
+        self.evaluate = ~self.reuse
+
+
+class PreviousOutput:
+    """ A previous PROCESSED file, indexed by its ID columns """
+    def __init__(self, path, id_columns, result_columns, status_column=None):
+        self.path = path
+        self.id_columns = list(id_columns)
+        self.result_columns = list(result_columns)
+        self.status_column = status_column
+        self.frame = read_output(path).reset_index(drop=True)
+
+        missing = [c for c in self.id_columns if c not in self.frame.columns]
+        if missing:
+            raise ValueError(f"Previous output {os.path.basename(path)} has no {', '.join(missing)} column(s)")
+        for col in self.result_columns:
+            if col not in self.frame.columns:
+                self.frame[col] = ''
+        self.frame[self.result_columns] = self.frame[self.result_columns].astype(object).where(
+            self.frame[self.result_columns].notna(), '')
+
+        key, empty = _keys(self.frame, self.id_columns)
+        self._keys = pd.Index(key)
+        self._empty = empty
+        self._all_keys = pd.Index(key[~empty])
+        self._unmatched = self.frame[self.result_columns].isin(RECHECK_VALUES).any(axis=1).to_numpy()
+        # Previous rows whose ID showed up in the current upload
+        self._seen = np.zeros(len(self.frame), dtype=bool)
+        # Built on the first plan(), once the compared columns and their types are known
+        self._index = None
+        self._columns = None
+        # (ID, fingerprint) -> rows seen so far, so chunked uploads keep counting occurrences
+        self._occurrences = Counter()
+        self.counts = Counter()
+        self.transitions = Counter()
+        self.now_matched = 0
+
+    def _fingerprints(self, frame):
+        canonical = pd.DataFrame({col: _canonical(frame[col], kind) for col, kind in self._columns}, index=frame.index)
+        return pd.util.hash_pandas_object(canonical, index=False).astype(str).to_numpy(dtype=object)
+
+    def _match_keys(self, key, fingerprint, counts):
+        # ID + fingerprint + occurrence number, so repeated IDs pair up in order
+        pair = pd.Series(key + '\x1f' + fingerprint)
+        occurrence = pair.groupby(pair, sort=False).cumcount() + pair.map(counts).fillna(0).astype(int)
+        counts.update(pair.tolist())
+        return (pair + '\x1f' + occurrence.astype(str)).to_numpy(dtype=object)
+
+    def plan(self, df, keys):
+        """ Label each row of df (NEW, CHANGED, RECHECKED or UNCHANGED); keys holds its ID columns """
+        if self._index is None:
+            self._columns = [
+                (c, _kind(df[c])) for c in df.columns if c in self.frame.columns
+                and c not in self.result_columns and c not in self.id_columns and c != CHANGE_COLUMN
+            ]
+            previous = self._match_keys(self._keys.to_numpy(dtype=object), self._fingerprints(self.frame), Counter())
+            self._rows = np.flatnonzero(~self._empty)
+            self._index = pd.Index(previous[self._rows])
+
+        key, empty = _keys(keys, self.id_columns)
+        self._seen |= self._keys.isin(key[~empty])
+
+        pos = self._index.get_indexer(self._match_keys(key, self._fingerprints(df), self._occurrences))
+        pos[empty] = -1
+        found = pos >= 0
+        rows = np.full(len(df), -1)
+        rows[found] = self._rows[pos[found]]
+
+        labels = np.where(pd.Index(key).isin(self._all_keys) & ~empty, CHANGED, NEW).astype(object)
+        recheck = np.zeros(len(df), dtype=bool)
+        recheck[found] = self._unmatched[rows[found]]
+        labels[found & recheck] = RECHECKED
+        labels[found & ~recheck] = UNCHANGED
+        return Plan(labels, rows)
+
+    def reuse(self, df, plan):
+        """ Copy the previous results into the rows that were not evaluated again """
+        if plan.reuse.any():
+            source = self.frame.iloc[plan.previous_rows[plan.reuse]]
+            for col in self.result_columns:
+                if col not in df.columns:
+                    df[col] = pd.Series('', index=df.index, dtype=object)
+                df.loc[plan.reuse, col] = source[col].to_numpy()
+
+    def record(self, df, plan):
+        """ Tally this frame's labels and how re-evaluated rows moved, then add the Change column """
+        self.counts.update(plan.labels.tolist())
+        redone = (plan.labels == RECHECKED) | (plan.labels == CHANGED)
+        redone &= plan.previous_rows >= 0
+        if redone.any():
+            now_unmatched = df.loc[redone, self.result_columns].isin(RECHECK_VALUES).any(axis=1).to_numpy()
+            was_unmatched = self._unmatched[plan.previous_rows[redone]]
+            self.now_matched += int((was_unmatched & ~now_unmatched).sum())
+            if self.status_column:
+                before = self.frame[self.status_column].to_numpy()[plan.previous_rows[redone]]
+                after = df.loc[redone, self.status_column].to_numpy()
+                self.transitions.update((b, a) for b, a in zip(before, after) if b != a)
+        df[CHANGE_COLUMN] = plan.labels
+        return df
+
+    def summary(self):
+        gone = int((~self._seen & ~self._empty).sum())
+        lines = [
+            f"Compared with {os.path.basename(self.path)}:\n",
+            f"   {self.counts[UNCHANGED]:,} rows unchanged (previous results kept)\n",
+            f"   {self.counts[NEW]:,} new, {self.counts[CHANGED]:,} changed, "
+            f"{self.counts[RECHECKED]:,} previously unmatched re-checked\n",
+            f"   {self.now_matched:,} previously unmatched rows now match\n",
+            f"   {gone:,} rows from the previous file are no longer in the upload\n",
+        ]
+        for (before, after), count in self.transitions.most_common(10):
+            lines.append(f"   {self.status_column}: {before or '(blank)'} -> {after or '(blank)'}: {count:,}\n")
+        return "".join(lines)
@@ -0,0 +1,213 @@
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from config import TRACE_DIR, TRACE_MEMORY
+
+# Spans still running in any thread or tracer; each one's peak is folded in before tracemalloc's peak is reset
+_open_spans = set()
+_memory_lock = threading.Lock()
+
+
+def _fold_peak():
+    # Caller holds _memory_lock
+    current, peak = tracemalloc.get_traced_memory()
+    for span in _open_spans:
+        span.peak = max(span.peak, peak)
+    tracemalloc.reset_peak()
+    return current
+
+
+class Span:
+    """ One timed stage; set .rows (and anything in .args) while it runs """
+    def __init__(self, name, parent=None, args=None):
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.args = dict(args or {})
+        self.rows = None
+        self.thread = threading.current_thread().name
+        self.tid = threading.get_ident()
+        self.start = self.end = None
+        self.memory_start = self.peak = 0
+
+    @property
+    def seconds(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    @property
+    def peak_bytes(self):
+        # Peak traced memory above what was allocated when the stage started
+        return max(0, self.peak - self.memory_start)
+
+
+class Tracer:
+    """ Per-run record of named stages with wall time, row counts and peak memory """
+    def __init__(self, name="run", memory=TRACE_MEMORY):
+        self.name = name
+        self.spans = []
+        self.started_at = datetime.now()
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # tracemalloc slows allocation-heavy code, so it only runs with CENSUS_TRACE_MEMORY=1
+        self.memory = memory
+        self._owns_tracemalloc = memory and not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        """ Innermost open stage on this thread, to hand to worker threads as their parent """
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def stage(self, name, parent=None, rows=None, **args):
+        stack = self._stack()
+        span = Span(name, parent or (stack[-1] if stack else None), args)
+        span.rows = rows
+        tracking = self.memory and tracemalloc.is_tracing()
+        if tracking:
+            with _memory_lock:
+                span.memory_start = span.peak = _fold_peak()
+                _open_spans.add(span)
+        with self._lock:
+            self.spans.append(span)
+        stack.append(span)
+        span.start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            stack.pop()
+            if tracking:
+                with _memory_lock:
+                    _fold_peak()
+                    _open_spans.discard(span)
+
+    def iterate(self, name, iterable):
+        """ Yield from iterable, timing each next() as its own stage """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as span:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    # The final, empty next() is not a stage
+                    with self._lock:
+                        self.spans.remove(span)
+                    return
+                span.rows = len(item) if hasattr(item, "__len__") else None
+            yield item
+
+    def records(self):
+        with self._lock:
+            spans = list(self.spans)
+        return [{
+            "name": span.name,
+            "parent": span.parent.name if span.parent else None,
+            "depth": span.depth,
+            "thread": span.thread,
+            "start": round(span.start - self.origin, 6),
+            "seconds": round(span.seconds, 6),
+            "rows": span.rows,
+            "peak_bytes": span.peak_bytes if self.memory else None,
+            **span.args,
+        } for span in spans]
+
+    def summary(self):
+        """ One line per stage name, in first-seen order, with repeated stages added up """
+        stages = {}
+        for record in self.records():
+            stage = stages.setdefault(record["name"], {"depth": record["depth"], "count": 0, "seconds": 0.0, "rows": None, "peak": None})
+            stage["count"] += 1
+            stage["seconds"] += record["seconds"]
+            if record["rows"] is not None:
+                stage["rows"] = (stage["rows"] or 0) + record["rows"]
+            if record["peak_bytes"] is not None:
+                stage["peak"] = max(stage["peak"] or 0, record["peak_bytes"])
+
+        lines = ["Stage timings:\n"]
+        for name, stage in stages.items():
+            label = "  " * (stage["depth"] + 1) + name + (f" (x{stage['count']})" if stage["count"] > 1 else "")
+            line = f"{label:<34}{stage['seconds']:>9.2f}s"
+            if stage["rows"] is not None:
+                line += f"{stage['rows']:>12,} rows"
+            if stage["peak"] is not None:
+                line += f"   peak +{stage['peak'] / 2**20:,.1f} MB"
+            lines.append(line + "\n")
+        return "".join(lines)
+
+    def chrome_trace(self):
+        """ Complete ("X") events for chrome://tracing or Perfetto """
+        with self._lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+                  for tid, thread in {span.tid: span.thread for span in spans}.items()]
+        for span in spans:
+            args = dict(span.args)
+            if span.rows is not None:
+                args["rows"] = span.rows
+            if self.memory:
+                args["peak_mb"] = round(span.peak_bytes / 2**20, 2)
+            events.append({
+                "name": span.name, "ph": "X", "pid": pid, "tid": span.tid,
+                "ts": round((span.start - self.origin) * 1e6), "dur": round(span.seconds * 1e6),
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"run": self.name}}
+
+    def write(self, directory=TRACE_DIR):
+        """ Write <run>.jsonl and <run>.trace.json; returns the JSONL path """
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", self.name).strip("_") or "run"
+        base = os.path.join(directory, f"{self.started_at:%Y%m%d_%H%M%S}_{slug}")
+        with open(base + ".jsonl", "w") as f:
+            for record in self.records():
+                f.write(json.dumps(record, default=str) + "\n")
+        with open(base + ".trace.json", "w") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        return base + ".jsonl"
+
+    def close(self):
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+
+class NullTracer(Tracer):
+    """ Stand-in when no tracer is passed; stages run untimed and nothing is kept """
+    def __init__(self):
+        self.memory = False
+
+    def current(self):
+        return None
+
+    @contextmanager
+    def stage(self, name, parent=None, rows=None, **args):
+        yield Span(name)
+
+    def iterate(self, name, iterable):
+        return iter(iterable)
+
+    def records(self):
+        return []
+
+    def write(self, directory=TRACE_DIR):
+        return None
+
+    def close(self):
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+
+def excel_serial(dates):
+    """ Excel serial day numbers as int64; missing dates become -1 """
+    days = (pd.Series(dates).dt.normalize() - EXCEL_EPOCH).dt.days
+    return days.fillna(-1).astype("int64").to_numpy()
+
+
+def take(values, positions, fill=np.nan):
+    """ values[positions] as an object array, with `fill` where the position is -1 """
+    values = np.asarray(values, dtype=object)
+    out = np.full(len(positions), fill, dtype=object)
+    hit = positions >= 0
+    out[hit] = values[positions[hit]]
+    return out
+
+
+class PatientKeyIndex:
+    # Normalized (last, first) names factorized once into int codes; lookups are array operations
+    def __init__(self, last, first):
+        self._last = pd.Index(pd.unique(pd.Series(last, dtype=object)))
+        self._first = pd.Index(pd.unique(pd.Series(first, dtype=object)))
+        self.codes = self.encode(last, first)
+        names, first_rows = np.unique(self.codes, return_index=True)
+        self._names = pd.Index(names)
+        self._first_rows = first_rows
+
+    def encode(self, last, first):
+        """ Name code per row, -1 when either part was never seen """
+        last_code = self._last.get_indexer(pd.Index(last, dtype=object))
+        first_code = self._first.get_indexer(pd.Index(first, dtype=object))
+        codes = last_code.astype("int64") * len(self._first) + first_code
+        return np.where((last_code >= 0) & (first_code >= 0), codes, -1)
+
+    def contains(self, last, first):
+        codes = self.encode(last, first)
+        return (codes >= 0) & (self._names.get_indexer(codes) >= 0)
+
+    def find(self, last, first):
+        """ Position of the first indexed row with this name, -1 when there is none """
+        codes = self.encode(last, first)
+        hit = self._names.get_indexer(codes)
+        return np.where((codes >= 0) & (hit >= 0), self._first_rows[hit], -1)
+
+    def table(self, key, keep="first"):
+        """ KeyTable for exact (name, key) lookups, e.g. key = excel_serial(DOS) or MRN """
+        return KeyTable(self, self.codes, key, keep)
+
+
+class KeyTable:
+    # (name code, key code) packed into one int64 -> row position in the indexed frame
+    def __init__(self, index, name_codes, key, keep="first"):
+        self.index = index
+        self._keys = pd.Index(pd.unique(pd.Series(key, dtype=object)))
+        combined = self._combine(name_codes, self._keys.get_indexer(pd.Index(key, dtype=object)))
+
+        positions = pd.Series(np.arange(len(combined)), index=combined)
+        positions = positions[~positions.index.duplicated(keep=keep)]
+        self._combined = positions.index
+        self._positions = positions.to_numpy()
+
+    def _combine(self, name_codes, key_codes):
+        combined = name_codes * (len(self._keys) + 1) + key_codes
+        return np.where((name_codes >= 0) & (key_codes >= 0), combined, -1)
+
+    def lookup(self, last, first, key):
+        """ Row position of the matching entry, -1 when there is none """
+        combined = self._combine(
+            self.index.encode(last, first),
+            self._keys.get_indexer(pd.Index(key, dtype=object)),
+        )
+        found = self._combined.get_indexer(combined)
+        found = np.where(combined >= 0, found, -1)
+        return np.where(found >= 0, self._positions[found], -1)
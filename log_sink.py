@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+import warnings
+from collections import deque
+from datetime import datetime
+from config import LOG_DIR
+
+# Row-level messages that are merged into one line with a count per flush
+ROW_PATTERNS = [
+    re.compile(r"^Skipping line \d+: .*"),
+    re.compile(r"^\[?(ERROR|WARN)\]?:? [Rr]ow \d+\b.*"),
+]
+FLUSH_INTERVAL_MS = 100
+MAX_PENDING = 2000
+MAX_WIDGET_LINES = 5000
+
+
+def _row_key(line):
+    for pattern in ROW_PATTERNS:
+        if pattern.match(line):
+            return pattern.pattern
+    return None
+
+
+class LogSink:
+    """
+    output_callback for the GUI: any thread can write, and the Tk thread flushes the
+    buffered text to the textbox once per FLUSH_INTERVAL_MS. Everything also goes to a log file.
+    """
+    def __init__(self, log_dir=LOG_DIR, capacity=MAX_PENDING, interval_ms=FLUSH_INTERVAL_MS):
+        self.interval_ms = interval_ms
+        self._pending = deque(maxlen=capacity)
+        self._dropped = 0
+        # pattern -> [count, first line]
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._widget = None
+        self._job = None
+        self._original_showwarning = None
+
+        self._file = None
+        self._at_line_start = True
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            self.path = os.path.join(log_dir, f"census_{datetime.now():%Y%m%d}.log")
+            self._file = open(self.path, "a", encoding="utf-8")
+        except OSError:
+            self.path = None
+
+    def __call__(self, text):
+        self.write(text)
+
+    def write(self, text):
+        with self._lock:
+            self._log(text)
+            for piece in text.splitlines(keepends=True):
+                key = _row_key(piece.strip())
+                if key is None:
+                    if len(self._pending) == self._pending.maxlen:
+                        self._dropped += 1
+                    self._pending.append(piece)
+                elif key in self._rows:
+                    self._rows[key][0] += 1
+                else:
+                    self._rows[key] = [1, piece.rstrip("\n")]
+
+    def _log(self, text):
+        # Full, uncoalesced copy with a timestamp on each line
+        if self._file is None:
+            return
+        stamp = f"{datetime.now():%Y-%m-%d %H:%M:%S} "
+        for piece in text.splitlines(keepends=True):
+            if self._at_line_start:
+                self._file.write(stamp)
+            self._file.write(piece)
+            self._at_line_start = piece.endswith("\n")
+
+    def drain(self):
+        """ Text buffered since the last drain, with row-level messages merged """
+        with self._lock:
+            text = "".join(self._pending)
+            self._pending.clear()
+            if self._dropped:
+                text = f"... {self._dropped} earlier messages not shown (see {self.path})\n" + text
+                self._dropped = 0
+            for count, first in self._rows.values():
+                more = f" (+{count - 1} more like this)" if count > 1 else ""
+                text += ("" if not text or text.endswith("\n") else "\n") + f"{first}{more}\n"
+            self._rows.clear()
+            if self._file is not None:
+                self._file.flush()
+        return text
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._rows.clear()
+            self._dropped = 0
+
+    def attach(self, widget):
+        """ Start flushing into a CTkTextbox; call from the Tk thread """
+        self._widget = widget
+        if self._job is None:
+            self._job = widget.after(self.interval_ms, self._tick)
+
+    def _tick(self):
+        text = self.drain()
+        if text:
+            widget = self._widget
+            widget.configure(state="normal")
+            widget.insert("end", text)
+            # Keep the textbox short; the log file has everything
+            lines = int(widget.index("end-1c").split(".")[0])
+            if lines > MAX_WIDGET_LINES:
+                widget.delete("1.0", f"{lines - MAX_WIDGET_LINES}.0")
+            widget.see("end")
+            widget.configure(state="disabled")
+        self._job = self._widget.after(self.interval_ms, self._tick)
+
+    def capture_warnings(self, categories=(Warning,)):
+        """ Route warnings (e.g. pandas' on_bad_lines='warn' ParserWarnings) into the sink """
+        if self._original_showwarning is not None:
+            return
+        self._original_showwarning = original = warnings.showwarning
+
+        def showwarning(message, category, filename, lineno, file=None, line=None):
+            if issubclass(category, categories):
+                self.write(str(message).rstrip("\n") + "\n")
+            else:
+                original(message, category, filename, lineno, file, line)
+
+        warnings.showwarning = showwarning
+
+    def close(self):
+        if self._original_showwarning is not None:
+            warnings.showwarning = self._original_showwarning
+            self._original_showwarning = None
+        if self._job is not None and self._widget is not None:
+            self._widget.after_cancel(self._job)
+            self._job = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
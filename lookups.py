@@ -0,0 +1,129 @@
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+from schema import dos_text, integer_text
+
+ENCOUNTER_COLUMNS = ['last', 'first', 'appointment', 'code', 'dos', 'provider']
+PATIENT_COLUMNS = ['last', 'first', 'dob', 'mrn']
+
+
+def text(series):
+    # Column-wise str(value).strip(); missing values become "nan" like str() does, whatever the dtype
+    if isinstance(series.dtype, pd.Int64Dtype):
+        series = integer_text(series)
+    if isinstance(series.dtype, pd.StringDtype):
+        return series.str.strip().fillna("nan")
+    if series.dtype != object:
+        # Categories, dates and numbers: each distinct value once, then spread by code
+        codes, uniques = pd.factorize(series)
+        labels = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.strip().to_numpy(dtype=object)
+        return pd.Series(np.append(labels, "nan")[codes], index=series.index, dtype=object)
+    return series.astype(str).fillna("nan").str.strip()
+
+
+def dos(series):
+    # DOS stays datetime64 when schema.tableau_frame parsed it, otherwise it is text like the rest;
+    # EncounterLookup hands it out as text either way
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return text(series)
+
+
+def normalize_encounters(df):
+    """ Upper-cased, stripped string columns used by the lookups, in Tableau row order """
+    return pd.DataFrame({
+        'last': text(df['Last Name']).str.upper(),
+        'first': text(df['FirstName']).str.upper(),
+        'appointment': text(df['Appointment FID']),
+        'code': text(df['Charge Code']).str.upper(),
+        'dos': dos(df['DOS']),
+        'provider': text(df['Provider']) if 'Provider' in df.columns else '',
+        'dob': text(df['DOB']),
+        'mrn': text(df['Chart Number']),
+    })
+
+
+class EncounterLookup(Mapping):
+    # (last, first) -> {appointment: [(code, dos, provider), ...]} view over a flat frame
+    def __init__(self, frame=None):
+        if frame is None:
+            frame = pd.DataFrame(columns=ENCOUNTER_COLUMNS)
+        self.frame = frame.reset_index(drop=True)
+        self._groups = None
+
+    def _index(self):
+        if self._groups is None:
+            groups = self.frame.groupby(['last', 'first'], sort=False).indices
+            # Keep names in first-seen order like the old dict
+            self._groups = dict(sorted(groups.items(), key=lambda kv: kv[1][0]))
+        return self._groups
+
+    def __getitem__(self, key):
+        rows = self.frame.iloc[self._index()[key]]
+        dates = rows['dos']
+        if pd.api.types.is_datetime64_any_dtype(dates):
+            dates = dos_text(dates).fillna("nan")
+        appts = {}
+        for appt, code, dos, provider in zip(rows['appointment'], rows['code'], dates, rows['provider']):
+            appts.setdefault(appt, []).append((code, dos, provider))
+        return appts
+
+    def __iter__(self):
+        return iter(self._index())
+
+    def __len__(self):
+        return len(self._index())
+
+    def __contains__(self, key):
+        return key in self._index()
+
+
+class PatientInfoLookup(Mapping):
+    # (last, first) -> {"dob": ..., "mrn": ...} from the first Tableau row for each name
+    def __init__(self, frame=None):
+        if frame is None:
+            frame = pd.DataFrame(columns=PATIENT_COLUMNS)
+        self.frame = frame.set_index(['last', 'first'])
+
+    def __getitem__(self, key):
+        row = self.frame.loc[key]
+        return {"dob": row['dob'], "mrn": row['mrn']}
+
+    def __iter__(self):
+        return iter(self.frame.index)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __contains__(self, key):
+        return key in self.frame.index
+
+
+def _distinct_encounters(enc):
+    # Stable sort groups each name's appointments in first-seen order, as the old nested dicts did
+    name_order = enc.groupby(['last', 'first'], sort=False).ngroup()
+    appt_order = enc.groupby(['last', 'first', 'appointment'], sort=False).ngroup()
+    return (
+        enc.assign(_name=name_order, _appt=appt_order)
+        .drop_duplicates(subset=['last', 'first', 'appointment', 'code', 'dos'], keep='first')
+        .sort_values(['_name', '_appt'], kind='stable')
+    )[ENCOUNTER_COLUMNS]
+
+
+def _first_patients(enc):
+    return enc.drop_duplicates(subset=['last', 'first'], keep='first')[PATIENT_COLUMNS]
+
+
+def encounter_frame(df):
+    """ Distinct (last, first, appointment, code, dos) rows, grouped by name then appointment in first-seen order """
+    return _distinct_encounters(normalize_encounters(df))
+
+
+def patient_frame(df):
+    """ DOB and MRN from the first Tableau row of each (last, first) """
+    return _first_patients(normalize_encounters(df))
+
+
+def build_lookups(df):
+    enc = normalize_encounters(df)
+    return EncounterLookup(_distinct_encounters(enc)), PatientInfoLookup(_first_patients(enc))
@@ -1,24 +1,85 @@
-import pandas as pd
+import csv
 import os
+import pandas as pd
+from sheets import find_header
+from upload_loader import cached_upload, load_upload
+from instrumentation import NULL_TRACER
+
+# Any DOS before this already clamps the answer to 01/01/2024
+CUTOFF = pd.Timestamp("2023-01-01")
+SCAN_BLOCK_ROWS = 5000
+
 
-def get_oldest_dos(file_path):
+def _dos_values(file_path):
+    """ Date of Service cell values, streamed row by row from the file """
     ext = os.path.splitext(file_path)[1].lower()
 
     if ext == ".csv":
-        df = pd.read_csv(file_path, usecols=["Date of Service"])
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            if "Date of Service" not in header:
+                raise ValueError("Usecols do not match columns, columns expected but not found: ['Date of Service']")
+            col = header.index("Date of Service")
+            for row in reader:
+                if col < len(row):
+                    yield row[col]
+
+    elif ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sheet, row = find_header(file_path)
+            ws = wb[sheet]
+            header = next(ws.iter_rows(min_row=row + 1, max_row=row + 1, values_only=True))
+            col = list(header).index("Date of Service") + 1
+            for (value,) in ws.iter_rows(min_row=row + 2, min_col=col, max_col=col, values_only=True):
+                yield value
+        finally:
+            wb.close()
+
     else:
-        xl = pd.ExcelFile(file_path)
-        for sheet in xl.sheet_names:
-            try:
-                df = xl.parse(sheet, usecols=["Date of Service"])
-                break
-            except ValueError:
-                continue
-        else:
-            raise ValueError("No sheet contains 'Date of Service' column")
+        # Legacy .xls has no streaming reader; parse it through the shared loader
+        yield from load_upload(file_path)["Date of Service"]
+
+
+def _scan_oldest(file_path):
+    # Running minimum over blocks of parsed dates; stops as soon as a date is before the cutoff
+    oldest = pd.NaT
+    block = []
+
+    def flush():
+        nonlocal oldest
+        parsed = pd.to_datetime(pd.Series(block, dtype=object), errors="coerce", format="mixed").dropna()
+        block.clear()
+        if len(parsed) and (pd.isnull(oldest) or parsed.min() < oldest):
+            oldest = parsed.min()
 
-    df["Date of Service"] = pd.to_datetime(df["Date of Service"], errors="coerce")
-    oldest_dos = df["Date of Service"].dropna().min()
+    for value in _dos_values(file_path):
+        if value is None or value == "":
+            continue
+        block.append(value)
+        if len(block) >= SCAN_BLOCK_ROWS:
+            flush()
+            if pd.notnull(oldest) and oldest < CUTOFF:
+                return oldest
+    if block:
+        flush()
+    return oldest
+
+
+def get_oldest_dos(file_path, tracer=None):
+    tracer = tracer or NULL_TRACER
+    # Reuse the parsed upload if the loader already has it, otherwise stream just the DOS column
+    df = cached_upload(file_path)
+    with tracer.stage("oldest dos", source="cached" if df is not None else "scan"):
+        if df is not None:
+            if "Date of Service" not in df.columns:
+                raise ValueError("Usecols do not match columns, columns expected but not found: ['Date of Service']")
+            oldest_dos = pd.to_datetime(df["Date of Service"], errors="coerce").dropna().min()
+        else:
+            oldest_dos = _scan_oldest(file_path)
 
     # Records past 2024 are already reconciled
     if pd.notnull(oldest_dos) and int(oldest_dos.strftime("%Y")) < 2023:
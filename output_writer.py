@@ -0,0 +1,180 @@
+import os
+from collections import Counter
+import pandas as pd
+from schema import output_frame
+
+OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
+# Rows in one Excel sheet, header included; xlsxwriter silently drops anything past it
+EXCEL_MAX_ROWS = 1_048_576
+
+
+class OutputWriter:
+    # Appends frames to one output file, counting summary values as each frame is written
+    def __init__(self, path, summary_columns=()):
+        self.path = path
+        self.summary_columns = list(summary_columns)
+        self.summary = {col: Counter() for col in self.summary_columns}
+        self.rows = 0
+
+    def write(self, df):
+        # Lean in-memory dtypes go back to plain values, so files look as they always did
+        df = output_frame(df)
+        for col in self.summary_columns:
+            if col in df.columns:
+                self.summary[col].update(df[col].fillna("").astype(str).value_counts().to_dict())
+        self._write(df)
+        self.rows += len(df)
+
+    def summary_frame(self):
+        rows = [
+            (col, value, count)
+            for col, counts in self.summary.items()
+            for value, count in sorted(counts.items(), key=lambda kv: -kv[1])
+        ]
+        return pd.DataFrame(rows, columns=["Column", "Value", "Count"])
+
+    def close(self):
+        self._close()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class XlsxStreamWriter(OutputWriter):
+    # xlsxwriter constant_memory mode flushes each row to disk as soon as the next one starts
+    def __init__(self, path, summary_columns=()):
+        super().__init__(path, summary_columns)
+        import xlsxwriter
+
+        self.workbook = xlsxwriter.Workbook(path, {
+            "constant_memory": True,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+            "nan_inf_to_errors": True,
+            # Same cell formats pandas.to_excel uses
+            "default_date_format": "yyyy-mm-dd hh:mm:ss",
+        })
+        self.sheet = self.workbook.add_worksheet("Sheet1")
+        self.header_format = self.workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        self.next_row = 0
+
+    def _write(self, df):
+        if self.next_row == 0:
+            self.sheet.write_row(0, 0, [str(c) for c in df.columns], self.header_format)
+            self.next_row = 1
+        if self.next_row + len(df) > EXCEL_MAX_ROWS:
+            raise ValueError(
+                f"{os.path.basename(self.path)} would need {self.next_row - 1 + len(df):,} rows; an Excel sheet "
+                f"holds {EXCEL_MAX_ROWS - 1:,}. Write csv or parquet output instead"
+            )
+
+        # Blank out missing values and hand xlsxwriter plain Python objects
+        columns = []
+        for col in df.columns:
+            values = df[col]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                values = pd.Series(values.dt.to_pydatetime(), index=values.index, dtype=object)
+            columns.append(values.astype(object).where(values.notna(), None))
+
+        write_row = self.sheet.write_row
+        row = self.next_row
+        for values in zip(*columns):
+            write_row(row, 0, values)
+            row += 1
+        self.next_row = row
+
+    def _close(self):
+        if self.summary_columns:
+            sheet = self.workbook.add_worksheet("Summary")
+            summary = self.summary_frame()
+            sheet.write_row(0, 0, list(summary.columns), self.header_format)
+            for i, values in enumerate(summary.itertuples(index=False, name=None), start=1):
+                sheet.write_row(i, 0, values)
+        self.workbook.close()
+
+
+class CsvWriter(OutputWriter):
+    def __init__(self, path, summary_columns=()):
+        super().__init__(path, summary_columns)
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.header = True
+
+    def _write(self, df):
+        df.to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def _close(self):
+        self.file.close()
+        _write_summary_sidecar(self)
+
+
+class ParquetWriter(OutputWriter):
+    def __init__(self, path, summary_columns=()):
+        super().__init__(path, summary_columns)
+        self.writer = None
+        self.schema = None
+
+    def _write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        df = df.copy()
+        for col in df.columns:
+            # Mixed object columns (e.g. numbers and text) are stored as text
+            if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ("string", "empty"):
+                df[col] = _as_text(df[col])
+
+        if self.writer is None:
+            schema = pa.Table.from_pandas(df, preserve_index=False).schema
+            # A column with no values in the first chunk has no real type yet; it is stored as
+            # text so later chunks with values still fit the file's schema
+            self.schema = pa.schema(
+                [field.with_type(pa.string()) if df[field.name].isna().all() else field for field in schema],
+                metadata=schema.metadata,
+            )
+            self._text_columns = [
+                field.name for field in self.schema
+                if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+            ]
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        for col in self._text_columns:
+            if df[col].dtype != object and not isinstance(df[col].dtype, pd.StringDtype):
+                df[col] = _as_text(df[col])
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def _close(self):
+        if self.writer is not None:
+            self.writer.close()
+        _write_summary_sidecar(self)
+
+
+def _as_text(series):
+    # Values as str, missing values left missing
+    series = series.astype(object)
+    return series.where(series.isna(), series.astype(str))
+
+
+def _write_summary_sidecar(writer):
+    if writer.summary_columns:
+        stem, _ = os.path.splitext(writer.path)
+        writer.summary_frame().to_csv(f"{stem}_summary.csv", index=False)
+
+
+WRITERS = {"xlsx": XlsxStreamWriter, "csv": CsvWriter, "parquet": ParquetWriter}
+
+
+def open_writer(path, fmt=None, summary_columns=()):
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported output format: {fmt}")
+    return WRITERS[fmt](path, summary_columns)
+
+
+def write_output(df, path, fmt=None, summary_columns=()):
+    with open_writer(path, fmt, summary_columns) as writer:
+        writer.write(df)
+    return path
@@ -1,119 +1,196 @@
 import pandas as pd
+import numpy as np
 import os
+import json
+from collections import Counter
+from output_writer import open_writer
+from key_index import PatientKeyIndex, excel_serial, take
+from config import CONCORD_EXCLUSIONS_PATH
+from upload_loader import load_upload
+from instrumentation import NULL_TRACER
+from incremental import PreviousOutput
+from lookups import text
+from schema import as_object, upload_frame
+from fuzzy_match import FuzzyIndex, CONFIDENCE_COLUMN
 
-def process_concord(df_tableau, file_path):
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext == ".csv":
-        df = pd.read_csv(file_path)
+
+# Strings pd.to_datetime reads as NaT instead of rejecting
+NAT_STRINGS = {'', 'nan', 'nat'}
+EXCLUSION_COLUMNS = ['Location Code', 'Department Code']
+ID_COLUMNS = ['ID (DOS_ACCT)', 'ID2 (DOS_MRN)']
+FILL_COLUMNS = {'Patient Name ': 'Patient Name', 'Facility': 'Facility Name', 'Carrier': 'Carrier', 'Provider': 'Provider'}
+
+
+def _digits(df, col):
+    if col not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[col].astype(str).fillna('nan').str.strip().str.replace(r'\D', '', regex=True)
+
+
+def load_exclusions(path=CONCORD_EXCLUSIONS_PATH):
+    """ Exclusion table with one row per (Location Code, Department Code) rule """
+    with open(path) as f:
+        return pd.DataFrame(json.load(f), columns=EXCLUSION_COLUMNS)
+
+
+def apply_exclusions(df, exclusions):
+    """ Drop rows matching any rule in one scan; returns the kept rows and rows removed per rule """
+    keys = pd.MultiIndex.from_frame(df[EXCLUSION_COLUMNS])
+    rules = pd.MultiIndex.from_frame(exclusions[EXCLUSION_COLUMNS])
+    hit = keys.isin(rules)
+    removed = keys[hit].value_counts()
+    return df[~hit], {rule: int(removed.get(rule, 0)) for rule in rules}
+
+
+def _report(removed, skipped, output_callback=None):
+    total = sum(removed.values())
+    lines = [f"Removed {total} non-Blitz rows.\n"]
+    lines += [f"   {loc} / {dept}: {count}\n" for (loc, dept), count in removed.items() if count]
+    if skipped:
+        lines.append(f"Skipped {skipped} rows with an unreadable Date of Service or Patient Name.\n")
+    if output_callback:
+        output_callback("".join(lines))
     else:
-        df = pd.read_excel(file_path)
-
-    # FILTER OUT NON-BLITZ
-    df = df[~((df['Location Code'] == 'CMG_ADVHMA') & (df['Department Code'] == 'ED'))]
-    df = df[~((df['Location Code'] == 'CMG_BREMH') & (df['Department Code'] == 'URGENTCARE'))]
-    df = df[~((df['Location Code'] == 'CMG_BREMH') & (df['Department Code'] == 'ED'))]
-    df = df[~((df['Location Code'] == 'CMG_CHSAL') & (df['Department Code'] == 'TELEPULM'))]
-    df = df[~((df['Location Code'] == 'CMG_CHSBV') & (df['Department Code'] == 'TELEPULM'))]
-    df = df[~((df['Location Code'] == 'CMG_CHSKV') & (df['Department Code'] == 'TELEPULM'))]
-    df = df[~((df['Location Code'] == 'CMG_DEMFD') & (df['Department Code'] == 'ED'))]
-    df = df[~((df['Location Code'] == 'CMG_MCGHTN') & (df['Department Code'] == 'ED'))]
-    df = df[~((df['Location Code'] == 'CMG_RMCTN') & (df['Department Code'] == 'ED'))]
-    df = df[~((df['Location Code'] == 'CMG_SUCCH') & (df['Department Code'] == 'ED'))]
-    df = df[~((df['Location Code'] == 'CMG_TAYRH') & (df['Department Code'] == 'ED'))]
-    df = df[~((df['Location Code'] == 'CMG_WDLN') & (df['Department Code'] == 'HOSPITALIST'))]
-
-    # NAME DICTIONARY
-    df_tableau['FirstName'] = df_tableau['FirstName'].astype(str).str.strip().str.upper().str.split().str[0]
-    df_tableau['Last Name'] = df_tableau['Last Name'].astype(str).str.strip()
-    df_tableau['DOS'] = pd.to_datetime(df_tableau['DOS'], errors='coerce')
-    df_tableau['Chart Number'] = df_tableau['Chart Number'].astype(str).str.strip()
-    name_lookup = {}
-    for _, row in df_tableau.iterrows():
-        key_dos = (
-            row['Last Name'],
-            row['FirstName'],
-            row['DOS'],
-        )
-        key_mrn = (
-            row['Last Name'],
-            row['FirstName'],
-            row['Chart Number'],
-        )
-        name_lookup[key_dos] = row.to_dict()
-        name_lookup[key_mrn] = row.to_dict()
-        
-    # ID INSERTION LOGIC and Tableau Fetch LOGIC
-    df.insert(0, 'ID (DOS_ACCT)', '')
-    df.insert(1, 'ID2 (DOS_MRN)', '') 
-    df.insert(2, 'ID3 (DOS_Patient Name)', '')
-    df.insert(3, 'Patient Name ', '')
-    df.insert(4, 'Facility', '')
-    df.insert(5, 'Carrier', '')
-    df.insert(6, 'Provider', '')
+        print("".join(lines), end="")
+
 
+def build_tableau_index(df_tableau, fuzzy=False):
+    """ Name/DOS and name/MRN key tables over Tableau; later rows win, like the old dict did """
+    tab_first = text(df_tableau['FirstName']).str.upper().str.split().str[0]
+    tab_last = text(df_tableau['Last Name'])
+    tab_dos = excel_serial(pd.to_datetime(df_tableau['DOS'], errors='coerce'))
+    tab_mrn = text(df_tableau['Chart Number'])
+    names = PatientKeyIndex(tab_last, tab_first)
+    index = {
+        'dos': names.table(tab_dos, keep='last'),
+        'mrn': names.table(tab_mrn, keep='last'),
+        'values': {
+            col: as_object(df_tableau[src]) if src in df_tableau.columns else np.full(len(df_tableau), '', dtype=object)
+            for col, src in FILL_COLUMNS.items()
+        },
+    }
+    if fuzzy:
+        index['fuzzy'] = FuzzyIndex(tab_last, tab_first, tab_dos, keep='last')
+    return index
+
+
+def reconcile(df, index, previous=None, tracer=NULL_TRACER):
+    """ Upload frame with the ID and Tableau columns added, and how many rows had to be left blank """
+    df = df.copy()
     df['Patient Name'] = df['Patient Name'].astype(str).str.strip()
     df['Date of Service'] = df['Date of Service'].astype(str).str.strip()
 
-    # Go row by row in df
-    for idx, row in df.iterrows():
-        try:
-            date_obj = pd.to_datetime(row['Date of Service'])
-            serial_date = str((date_obj - pd.Timestamp("1899-12-30")).days)
-
-            acct = str(row.get('Account Number', '')).strip()
-            acct = ''.join(filter(str.isdigit, acct))
-
-            mrn = str(row.get('Medical Record Number', '')).strip()
-            mrn = ''.join(filter(str.isdigit, mrn)) 
-
-            patient_name = str(row.get('Patient Name', '')).strip()
-
-            last_first = patient_name.split(',')
-            if len(last_first) != 2:
-                continue
-
-            last = last_first[0].strip().upper()
-            first = last_first[1].strip().upper().split()[0]
-
-            # IDs
-            if acct:
-                combined_id = serial_date + acct
-                df.at[idx, 'ID (DOS_ACCT)'] = combined_id
-            if mrn:
-                combined_id_2 = serial_date + mrn
-                df.at[idx, 'ID2 (DOS_MRN)'] = combined_id_2
-            if patient_name:
-                combined_id_3 = serial_date + patient_name
-                df.at[idx, 'ID3 (DOS_Patient Name)'] = combined_id_3
-            
-            # CHECK NAME/DOS and NAME/MRN and if either match then fetch lookup info with key
-            match = None
-            key = (last, first, date_obj)
-            key2 = (last, first, mrn)
-            if key in name_lookup:
-                match = name_lookup[key]
-            elif key2 in name_lookup:
-                match = name_lookup[key2]
-                
-            if match:
-                df.at[idx, 'Patient Name '] = match.get('Patient Name', '')
-                df.at[idx, 'Provider'] = match.get('Provider', '')
-                df.at[idx, 'Carrier'] = match.get('Carrier', '')
-                df.at[idx, 'Facility'] = match.get('Facility Name', '')
-            else:
-                df.at[idx, 'Patient Name '] = '#N/A'
-                df.at[idx, 'Provider'] = '#N/A'
-                df.at[idx, 'Carrier'] = '#N/A'
-                df.at[idx, 'Facility'] = '#N/A'
-
-        except Exception as e:
-            print(f"Row {idx} error: {e}")
+    # DOS, then (last, first) from "LAST, FIRST ..." - rows without both are left blank
+    dos_text = df['Date of Service']
+    dos = pd.to_datetime(dos_text, errors='coerce', format='mixed')
+    nat_text = dos_text.isna() | dos_text.str.lower().isin(NAT_STRINGS)
+    parts = df['Patient Name'].str.split(',')
+    last = parts.str[0].str.strip().str.upper()
+    first = parts.str[1].str.strip().str.upper().str.split().str[0]
+    bad_dos = dos.isna() & ~nat_text
+    valid = (~bad_dos & (parts.str.len() == 2) & first.notna()).to_numpy()
+
+    serial = pd.Series(excel_serial(dos).astype(str), index=df.index).where(~nat_text, 'nan')
+    acct = _digits(df, 'Account Number')
+    mrn = _digits(df, 'Medical Record Number')
 
+    # ID INSERTION LOGIC
+    ids = {
+        'ID (DOS_ACCT)': np.where(valid & (acct != '').to_numpy(), serial + acct, ''),
+        'ID2 (DOS_MRN)': np.where(valid & (mrn != '').to_numpy(), serial + mrn, ''),
+        'ID3 (DOS_Patient Name)': np.where(valid & (df['Patient Name'] != '').to_numpy(), serial + df['Patient Name'], ''),
+    }
+
+    # INCREMENTAL MODE - only new, changed or previously unmatched rows are looked up
+    plan = None
+    evaluate = np.ones(len(df), dtype=bool)
+    if previous is not None:
+        plan = previous.plan(df, pd.DataFrame(ids, index=df.index))
+        evaluate = plan.evaluate
+
+    # CHECK NAME/DOS and then NAME/MRN
+    pos = np.full(len(df), -1)
+    if evaluate.any():
+        pos[evaluate] = index['dos'].lookup(last[evaluate], first[evaluate], excel_serial(dos[evaluate]))
+        missing = evaluate & (pos < 0)
+        pos[missing] = index['mrn'].lookup(last[missing], first[missing], mrn[missing])
+
+    # FUZZY PASS - similar names on the same DOS for rows neither key found
+    fuzzy = 'fuzzy' in index
+    if fuzzy:
+        confidence = np.where(pos >= 0, 1.0, np.nan)
+        missing = np.flatnonzero(evaluate & valid & (pos < 0))
+        with tracer.stage("fuzzy match", rows=len(missing)):
+            if len(missing):
+                hit, score = index['fuzzy'].match(
+                    last.to_numpy(dtype=object)[missing], first.to_numpy(dtype=object)[missing], excel_serial(dos)[missing]
+                )
+                pos[missing] = hit
+                confidence[missing] = score
+    fills = {}
+    for col, values in index['values'].items():
+        fills[col] = np.where(valid, take(values, pos, fill='#N/A'), '')
+    if fuzzy:
+        fills[CONFIDENCE_COLUMN] = np.where(valid, confidence, np.nan)
+
+    for i, (col, values) in enumerate(list(ids.items()) + list(fills.items())):
+        df.insert(i, col, pd.Series(values, index=df.index, dtype=object))
+
+    if plan is not None:
+        previous.reuse(df, plan)
+    if fuzzy:
+        df[CONFIDENCE_COLUMN] = pd.to_numeric(df[CONFIDENCE_COLUMN], errors='coerce')
+    if plan is not None:
+        df = previous.record(df, plan)
+    return df, int((~valid).sum())
+
+
+def process_concord(df_tableau, file_path, output_format=None, output_callback=None, chunksize=None, tracer=None,
+                    previous_output=None, fuzzy=False):
+    tracer = tracer or NULL_TRACER
+    ext = os.path.splitext(file_path)[1].lower()
+
+    # Output keeps the upload's format unless another one is requested
     new_file_path = os.path.join(os.path.dirname(file_path), "PROCESSED_____" + os.path.basename(file_path))
+    if output_format:
+        new_file_path = os.path.splitext(new_file_path)[0] + "." + output_format
+    else:
+        output_format = "csv" if ext == ".csv" else "xlsx"
+        if ext != ".csv":
+            new_file_path = os.path.splitext(new_file_path)[0] + ".xlsx"
+
+    with tracer.stage("index tableau", rows=len(df_tableau)):
+        index = build_tableau_index(df_tableau, fuzzy)
+    exclusions = load_exclusions()
+    result_columns = list(FILL_COLUMNS) + ([CONFIDENCE_COLUMN] if fuzzy else [])
+    previous = PreviousOutput(previous_output, ID_COLUMNS, result_columns) if previous_output else None
 
-    if ext == ".csv":
-        df.to_csv(new_file_path, index=False)
+    # CSV is read as text so every chunk sees the same values, whether chunked or not
+    if ext == ".csv" and chunksize:
+        chunks = (upload_frame(chunk) for chunk in pd.read_csv(file_path, dtype=str, chunksize=chunksize))
     else:
-        df.to_excel(new_file_path, index=False)
-    
-    return new_file_path 
\ No newline at end of file
+        chunks = [load_upload(file_path)]
+
+    # Streaming mode: each chunk is filtered, reconciled and appended before the next is read
+    removed = Counter()
+    skipped = 0
+    with open_writer(new_file_path, output_format) as writer:
+        for df in tracer.iterate("load upload", chunks):
+            # FILTER OUT NON-BLITZ
+            with tracer.stage("exclusions", rows=len(df)):
+                df, chunk_removed = apply_exclusions(df, exclusions)
+                removed.update(chunk_removed)
+
+            with tracer.stage("reconcile", rows=len(df)):
+                df, chunk_skipped = reconcile(df, index, previous, tracer)
+                skipped += chunk_skipped
+            with tracer.stage("write output", rows=len(df), format=output_format):
+                writer.write(df)
+
+    _report(removed, skipped, output_callback)
+    if previous is not None:
+        if output_callback:
+            output_callback(previous.summary())
+        else:
+            print(previous.summary(), end="")
+    return new_file_path
@@ -2,161 +2,186 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import traceback
-
-def process_excel_file(file_path, license_key, encounter_lookup=None, df_tableau=None, tableau_fetcher=None, output_callback=None):
+from upload_loader import load_upload
+from output_writer import write_output
+from lookups import encounter_frame, patient_frame
+from key_index import PatientKeyIndex, excel_serial, take
+from client_rules import compile_rules
+from instrumentation import NULL_TRACER
+from incremental import PreviousOutput
+from fuzzy_match import FuzzyIndex, CONFIDENCE_COLUMN
+from config import FUZZY_DOS_WINDOW_DAYS
+
+SUMMARY_COLUMNS = ['Status', 'Census Reconciliation']
+ID_COLUMNS = ['ID1', 'ID2']
+
+def _match_table(enc):
+    # Tableau encounters in the order the old nested lookup iterated them, dates parsed column-wise
+    return pd.DataFrame({
+        'Last Name': enc['last'].values,
+        'FirstKey': enc['first'].str.split().str[0].values,
+        'DosLookup': pd.to_datetime(enc['dos'], format='%m/%d/%Y', errors='coerce').dt.normalize().values,
+        'Code': enc['code'].values,
+        'ProviderLookup': enc['provider'].values,
+    })
+
+
+def _patient_table(df_tableau, patient_info_lookup):
+    # MRN and MM/DD/YYYY DOB per (last, first); DOBs come in mixed formats so each is parsed on its own
+    if hasattr(patient_info_lookup, 'frame'):
+        info = patient_info_lookup.frame.reset_index()
+    else:
+        info = patient_frame(df_tableau)
+    dob = pd.to_datetime(info['dob'], format='mixed', errors='coerce')
+    return pd.DataFrame({
+        'last': info['last'], 'first': info['first'], 'mrn': info['mrn'],
+        'dob': dob.dt.strftime('%m/%d/%Y').fillna(""),
+    })
+
+
+def _encounter_index(enc):
+    # One Tableau encounter per (Last Name, FirstKey, DOS), 99xxx codes first, and its exact join table
+    enc_df = _match_table(enc)
+
+    enc_df['is_99'] = enc_df['Code'].str.startswith('99', na=False)
+
+    enc_df = enc_df.sort_values(
+        ['Last Name','FirstKey','DosLookup','is_99'],
+        ascending=[True, True, True, False]
+    )
+
+    enc_df = enc_df.drop_duplicates(
+        subset=['Last Name','FirstKey','DosLookup'],
+        keep='first'
+    ).drop(columns='is_99')
+
+    # Exact (Last Name, FirstKey, DOS) join on integer codes
+    dos_table = PatientKeyIndex(enc_df['Last Name'], enc_df['FirstKey']).table(
+        excel_serial(enc_df['DosLookup'])
+    )
+    return enc_df, dos_table
+
+
+def _name_found(df, enc):
+    # Tableau names are (last, full first name), as in encounter_lookup
+    return PatientKeyIndex(enc['last'], enc['first']).contains(df['Last Name'], df['FirstKey'])
+
+
+def _fuzzy_pass(df, enc_df, pos, name_found):
+    # Rows without an exact encounter, scored against similar Tableau names around their DOS
+    index = FuzzyIndex(enc_df['Last Name'], enc_df['FirstKey'], excel_serial(enc_df['DosLookup']))
+    days = excel_serial(df['DosNormalize'])
+    last = df['Last Name'].to_numpy(dtype=object)
+    first = df['FirstKey'].to_numpy(dtype=object)
+    match_last, match_first = last.copy(), first.copy()
+    confidence = np.where(name_found, 1.0, np.nan)
+
+    # Only names Tableau does not know, which may also have been entered a day off. A known name
+    # without an encounter on its DOS keeps its own name and stays a DOS mismatch.
+    rows = np.flatnonzero((pos < 0) & ~name_found)
+    if len(rows):
+        hit, score = index.match(last[rows], first[rows], days[rows], FUZZY_DOS_WINDOW_DAYS)
+        rows, hit, score = rows[hit >= 0], hit[hit >= 0], score[hit >= 0]
+        match_last[rows] = enc_df['Last Name'].to_numpy(dtype=object)[hit]
+        match_first[rows] = enc_df['FirstKey'].to_numpy(dtype=object)[hit]
+        name_found[rows] = True
+        confidence[rows] = score
+    return match_last, match_first, name_found, confidence
+
+
+def _resolve_names(df, enc, enc_df, dos_table):
+    # Tableau name each row is looked up by from here on: its own, or the one the fuzzy pass matched
+    pos = dos_table.lookup(df['Last Name'], df['FirstKey'], excel_serial(df['DosNormalize']))
+    df['MatchLast'], df['MatchFirst'], df['NameFound'], df['MatchScore'] = _fuzzy_pass(
+        df, enc_df, pos, _name_found(df, enc)
+    )
+
+
+def _lookup_names(df):
+    if 'MatchLast' in df.columns:
+        return df['MatchLast'], df['MatchFirst']
+    return df['Last Name'], df['FirstKey']
+
+
+def _match_encounters(df, enc, enc_df, dos_table, license_key):
+    # Exact (Last Name, FirstKey, DOS) match against Tableau, then the client's status rules
+    last, first = _lookup_names(df)
+    pos = dos_table.lookup(last, first, excel_serial(df['DosNormalize']))
+
+    if 'NameFound' in df.columns:
+        name_found = df['NameFound'].to_numpy(dtype=bool)
+        df[CONFIDENCE_COLUMN] = df['MatchScore'].to_numpy()
+    else:
+        name_found = _name_found(df, enc)
+
+    df['Code'] = take(enc_df['Code'], pos)
+    df['ProviderLookup'] = take(enc_df['ProviderLookup'], pos)
+
+    df['Provider'] = df['ProviderLookup'].fillna("")
+
+    # LICENSE-SPECIFIC LOGIC - status columns come from the client's rule table
+    compile_rules(license_key).evaluate(df, name_found)
+
+
+def process_excel_file(file_path, license_key, encounter_lookup=None, df_tableau=None, tableau_fetcher=None, output_callback=None,
+                       output_format="xlsx", summary=False, tracer=None, previous_output=None, fuzzy=False):
+    tracer = tracer or NULL_TRACER
     try:
         if output_callback:
             output_callback("Processing Excel file... May take some time for larger files\n")
 
-        xl = pd.ExcelFile(file_path)
-        for sheet in xl.sheet_names:
-            try:
-                df = xl.parse(sheet)
-                if "Date of Service" in df.columns:
-                    break
-            except Exception:
-                continue
-        else:
-            raise ValueError("No sheet contains 'Date of Service' column")
-
-        # Convert DOS column to datetime after finding correct sheet
-        df["Date of Service"] = pd.to_datetime(df["Date of Service"], errors="coerce")
-
-        # GET FIRST KEY
-        if 'Patient Name' in df.columns:
-            names = df['Patient Name'].astype(str).str.split(',', n=1, expand=True)
-            df['Last Name']  = names[0].str.strip().str.upper()
-            df['First Name'] = names[1].str.strip().str.upper().fillna("")
-            # key is first token before any space
-            df['FirstKey']  = df['First Name'].str.split().str[0]
-
-        if 'PatientName' in df.columns:
-            names = df['PatientName'].astype(str).str.split(',', n=1, expand=True)
-            df['Last Name']  = names[0].str.strip().str.upper()
-            df['First Name'] = names[1].str.strip().str.upper().fillna("")
-            # key is first token before any space
-            df['FirstKey']  = df['First Name'].str.split().str[0]
-
-        # COLUMNS TO ADD
-        cols_to_init = [
-            'Provider','Patient MRN','Patient DOB',
-            'ID1','ID2','ID3','Census Reconciliation','UNBILLED','E&M (Pro)','Status'
-        ]
-        for col in cols_to_init:
-            if col not in df.columns:
-                df[col] = ""
-
-        df['DosNormalize'] = df['Date of Service'].dt.normalize()
-
-        # CREATE ENCOUNTER LOOKUP
-        if encounter_lookup and license_key in ('160214', '137797'):
-            enc_rows = []
-            for (last, first), appts in encounter_lookup.items():
-                key_first = first.upper().split()[0]
-                for appt_id, entries in appts.items():
-                    for code, dos_str, provider in entries:
-                        enc_rows.append({
-                            'Last Name': last,
-                            'FirstKey': key_first,
-                            'DosLookup': pd.to_datetime(
-                                dos_str, format='%m/%d/%Y', errors='coerce'
-                            ).normalize(),
-                            'Code': code,
-                            'ProviderLookup': provider
-                        })
-            enc_df = pd.DataFrame(enc_rows)
-
-            enc_df['is_99'] = enc_df['Code'].str.startswith('99', na=False)
-
-            enc_df = enc_df.sort_values(
-                ['Last Name','FirstKey','DosLookup','is_99'],
-                ascending=[True, True, True, False]
-            )
-
-            enc_df = enc_df.drop_duplicates(
-                subset=['Last Name','FirstKey','DosLookup'],
-                keep='first'
-            ).drop(columns='is_99')
-
-            df = df.merge(
-                enc_df,
-                left_on=['Last Name','FirstKey','DosNormalize'],
-                right_on=['Last Name','FirstKey','DosLookup'],
-                how='left'
-            )
-
-            df['Provider'] = df['ProviderLookup'].fillna("")
-
-            # LICENSE-SPECIFIC LOGIC
-            if license_key == '160214':
-                cond_billed = df['Code'].str.startswith('99', na=False)
-                cond_lwbs   = df['Code']=='LWBS'
-                cond_ama    = df['Code']=='AMA'
-                cond_zero   = df['Code']=='0'
-                cond_null   = df['Code']=='NULL'
-
-                df['use_code'] = np.select(
-                    [cond_lwbs, cond_ama, cond_zero, cond_null, cond_billed],
-                    ['LWBS','AMA','0','NULL', df['Code']],
-                    default=''
-                )
-                df['Census Reconciliation'] = np.select(
-                    [cond_lwbs, cond_ama, cond_zero, cond_null, cond_billed],
-                    ['LWBS','AMA','NON ED ENCOUNTERS','', 'BILLED'],
-                    default='#N/A'
-                )
-                
-                df['Status'] = np.where(df['use_code']=='', 'MISMATCH DOS', 'OPEN')
-
-                df.loc[
-                    cond_billed & df['Census Reconciliation'].isin(['BILLED','LWBS','AMA']),
-                    'Status'
-                ] = 'DE_COMPLETE'
-
-                # INVALID CODES
-                cond_invalid = df['Code'].notna() & ~(
-                    cond_lwbs | cond_ama | cond_zero | cond_null | cond_billed
-                )
-                df.loc[cond_invalid, 'Status'] = 'INVALID CODE IN TABLEAU'
-
-                df['E&M (Pro)'] = df['use_code']
-
-                tableau_keys = set(encounter_lookup.keys())
-                key_series = pd.Series(list(zip(df['Last Name'], df['FirstKey'])))
-                mask_name_exists = key_series.isin(tableau_keys)
-                df.loc[~mask_name_exists, 'Status'] = 'NAME NOT FOUND IN TABLEAU'
-                
-            elif license_key == '137797':
-                tableau_keys = set(encounter_lookup.keys())
-                patient_keys    = list(zip(df['Last Name'], df['FirstKey']))
-                mask_exists     = [k in tableau_keys for k in patient_keys]
-                mask_dos_matched = df['Code'].notna()
-                statuses        = df['Status'].fillna('').astype(str)
-
-                # ABANDONED = blank, else BILELD or MISMATCHED depending on if DOS matches, and lastly NAME NOT IN TABLEAU if none
-                df['Census Reconciliation'] = [
-                    "" if stat == 'ABANDONED' else
-                    'BILLED'         if ex and matched else
-                    'MISMATCHED DOS' if ex and not matched else
-                    'NAME NOT IN TABLEAU'
-                    for stat, ex, matched in zip(statuses, mask_exists, mask_dos_matched)
-                ]
+        with tracer.stage("load upload") as span:
+            df = load_upload(file_path)
+            span.rows = len(df)
+
+        with tracer.stage("normalize keys", rows=len(df)):
+            # Convert DOS column to datetime after finding correct sheet
+            df["Date of Service"] = pd.to_datetime(df["Date of Service"], errors="coerce")
+
+            # GET FIRST KEY
+            if 'Patient Name' in df.columns:
+                names = df['Patient Name'].astype(str).str.split(',', n=1, expand=True)
+                df['Last Name']  = names[0].str.strip().str.upper()
+                df['First Name'] = names[1].str.strip().str.upper().fillna("")
+                # key is first token before any space
+                df['FirstKey']  = df['First Name'].str.split().str[0]
+
+            if 'PatientName' in df.columns:
+                names = df['PatientName'].astype(str).str.split(',', n=1, expand=True)
+                df['Last Name']  = names[0].str.strip().str.upper()
+                df['First Name'] = names[1].str.strip().str.upper().fillna("")
+                # key is first token before any space
+                df['FirstKey']  = df['First Name'].str.split().str[0]
+
+            # COLUMNS TO ADD
+            cols_to_init = [
+                'Provider','Patient MRN','Patient DOB',
+                'ID1','ID2','ID3','Census Reconciliation','UNBILLED','E&M (Pro)','Status'
+            ]
+            for col in cols_to_init:
+                if col not in df.columns:
+                    df[col] = ""
+
+            df['DosNormalize'] = df['Date of Service'].dt.normalize()
+
+        match = bool(encounter_lookup) and license_key in ('160214', '137797')
+        if match:
+            with tracer.stage("index tableau"):
+                # fetch_data already normalized the extract into the lookup's frame
+                enc = encounter_lookup.frame if hasattr(encounter_lookup, 'frame') else encounter_frame(df_tableau)
+                enc_df, dos_table = _encounter_index(enc)
+
+        # FUZZY PASS - before patient info and IDs, so Larkin's MRN/DOB come from the matched Tableau name
+        if fuzzy and match:
+            with tracer.stage("fuzzy match", rows=len(df)):
+                _resolve_names(df, enc, enc_df, dos_table)
 
         if tableau_fetcher and getattr(tableau_fetcher, 'patient_info_lookup', None) and license_key == '137797':
-            mrn_map = {}
-            dob_map = {}
-            for (l, f), info in tableau_fetcher.patient_info_lookup.items():
-                key = (l.upper(), f.upper())
-                mrn_map[key] = info.get('mrn', '') 
-                raw_dob = info.get('dob', '')
-                dob_ts  = pd.to_datetime(raw_dob, errors='coerce')
-                if pd.notnull(dob_ts):
-                    dob_map[key] = dob_ts.strftime('%m/%d/%Y')
-                else:
-                    dob_map[key] = ""
-            keys = list(zip(df['Last Name'], df['FirstKey']))
-            df['Patient MRN'] = [mrn_map.get(k, "") for k in keys]
-            df['Patient DOB'] = [dob_map.get(k, "") for k in keys]
+            with tracer.stage("patient info", rows=len(df)):
+                info = _patient_table(df_tableau, tableau_fetcher.patient_info_lookup)
+                pos = PatientKeyIndex(info['last'], info['first']).find(*_lookup_names(df))
+                df['Patient MRN'] = take(info['mrn'], pos, fill="")
+                df['Patient DOB'] = take(info['dob'], pos, fill="")
 
         # GENERATE IDs
         if license_key in ('160214','137797'):
@@ -171,10 +196,35 @@ def process_excel_file(file_path, license_key, encounter_lookup=None, df_tableau
             df['ID2'] = serial_DOS + serial_DOB + df['Last Name']
             df['ID3'] = ''
 
+        # INCREMENTAL MODE - IDs come first so unchanged rows can keep the previous results
+        plan = None
+        if previous_output:
+            rule_columns = [column for column, _, _ in compile_rules(license_key).columns]
+            previous = PreviousOutput(
+                previous_output, ID_COLUMNS, ['Provider'] + rule_columns + ([CONFIDENCE_COLUMN] if fuzzy else []),
+                status_column='Status' if 'Status' in rule_columns else 'Census Reconciliation',
+            )
+            plan = previous.plan(df, df)
+            previous.reuse(df, plan)
+
+        # CREATE ENCOUNTER LOOKUP
+        if match:
+            with tracer.stage("match encounters", rows=len(df) if plan is None else int(plan.evaluate.sum())):
+                if plan is None:
+                    _match_encounters(df, enc, enc_df, dos_table, license_key)
+                elif plan.evaluate.any():
+                    changed = df[plan.evaluate].copy()
+                    _match_encounters(changed, enc, enc_df, dos_table, license_key)
+                    for col in previous.result_columns:
+                        df.loc[plan.evaluate, col] = changed[col].to_numpy()
+                if fuzzy:
+                    df[CONFIDENCE_COLUMN] = pd.to_numeric(df[CONFIDENCE_COLUMN], errors='coerce')
+
         # DROP TEMP COLUMNS
         df.drop(columns=[
             'DosNormalize','DosLookup','ProviderLookup','Code',
-            'use_code','DosNorm','DobNorm','MRN','DobLookup','FirstKey'
+            'use_code','DosNorm','DobNorm','MRN','DobLookup','FirstKey',
+            'MatchLast','MatchFirst','NameFound','MatchScore'
         ], errors='ignore', inplace=True)
 
         # REORDER COLUMNS
@@ -182,13 +232,19 @@ def process_excel_file(file_path, license_key, encounter_lookup=None, df_tableau
             'ID1','ID2','ID3',
             'Date of Service','Date Billed','Facility','Patient Account #',
             'Patient MRN','Patient DOB','Patient Name','Last Name','First Name',
-            'E&M (Fac)','E&M (Pro)','Status','Census Reconciliation','UNBILLED','Provider'
+            'E&M (Fac)','E&M (Pro)','Status','Census Reconciliation','UNBILLED','Provider',CONFIDENCE_COLUMN
         ]
         cols = [c for c in desired if c in df.columns] + [c for c in df.columns if c not in desired]
         df = df[cols]
-
-        out = Path(file_path).with_name(f"PROCESSED______{Path(file_path).stem}.xlsx")
-        df.to_excel(out, index=False)
+        if plan is not None:
+            df = previous.record(df, plan)
+            if output_callback:
+                output_callback(previous.summary())
+
+        out = Path(file_path).with_name(f"PROCESSED______{Path(file_path).stem}.{output_format}")
+        # Summary sheet counts are taken while the rows are written
+        with tracer.stage("write output", rows=len(df), format=output_format):
+            write_output(df, str(out), output_format, SUMMARY_COLUMNS if summary else ())
         if output_callback:
             output_callback(f"Processed file saved: {out}\n")
         return out
@@ -0,0 +1,155 @@
+"""
+Column dtypes for data held in memory.
+
+Tableau extracts arrive as text. tableau_frame stores repeated labels as categoricals,
+names and other free text as Arrow-backed strings, DOS as datetime64, and all-digit IDs
+as nullable integers.
+
+A conversion only happens when it loses nothing. DOS becomes datetime64 only if every
+value comes back unchanged from dos_text. An ID with leading zeros stays text.
+
+output_frame turns the same dtypes back into plain values just before a frame is written.
+"""
+import numpy as np
+import pandas as pd
+
+CATEGORY, STRING, DATE, INTEGER = 'category', 'string', 'date', 'integer'
+
+TABLEAU_SCHEMA = {
+    'Provider': CATEGORY,
+    'Facility Name': CATEGORY,
+    'Carrier': CATEGORY,
+    'Charge Code': CATEGORY,
+    'DOS': DATE,
+    'Appointment FID': INTEGER,
+    'Chart Number': INTEGER,
+    'Last Name': STRING,
+    'FirstName': STRING,
+    'Patient Name': STRING,
+    'DOB': STRING,
+}
+
+# Upload columns that repeat a few values and are only ever read
+UPLOAD_SCHEMA = {
+    'Facility': CATEGORY,
+    'Location Code': CATEGORY,
+    'Department Code': CATEGORY,
+}
+
+DOS_FORMAT = "%m/%d/%Y"
+
+
+def _string_dtype():
+    # Arrow-backed strings when pyarrow is installed, otherwise columns stay object
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    return pd.StringDtype("pyarrow")
+
+
+STRING_DTYPE = _string_dtype()
+
+
+def _is_text(series):
+    return series.dtype == object or isinstance(series.dtype, pd.StringDtype)
+
+
+def parse_dos(series):
+    """ Tableau DOS text ("1/5/2024") as datetime64; other layouts are parsed one by one """
+    parsed = pd.to_datetime(series, format=DOS_FORMAT, errors="coerce")
+    missing = parsed.isna() & series.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(series[missing], format="mixed", errors="coerce")
+    return parsed
+
+
+def dos_text(series):
+    """ datetime64 DOS as Tableau writes it ("1/5/2024"), NaN where missing; each distinct day is formatted once """
+    codes, days = pd.factorize(series)
+    labels = np.array([f"{day.month}/{day.day}/{day.year}" for day in days] + [np.nan], dtype=object)
+    return pd.Series(labels[codes], index=series.index, dtype=object)
+
+
+def _as_category(series):
+    return series.astype("category")
+
+
+def _as_string(series):
+    if STRING_DTYPE is None or series.dtype == STRING_DTYPE:
+        return series
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+        return series
+    return series.astype(STRING_DTYPE)
+
+
+def _as_date(series):
+    codes, values = pd.factorize(series)
+    parsed = parse_dos(pd.Series(np.asarray(values, dtype=object)))
+    # Only when every DOS is a plain date that dos_text writes back as the same text
+    if parsed.isna().any() or not (dos_text(parsed).to_numpy() == np.asarray(values, dtype=object)).all():
+        return _as_string(series)
+    return pd.Series(pd.DatetimeIndex(parsed).take(codes, allow_fill=True, fill_value=pd.NaT), index=series.index)
+
+
+def _as_integer(series):
+    text = _as_string(series)
+    # Only integers written the way they read back: no "007", "+7" or "-0"
+    if not text.dropna().str.fullmatch(r"0|-?[1-9]\d{0,17}", na=False).all():
+        return text
+    return text.astype("Int64")
+
+
+def integer_text(series):
+    """ Nullable integer column as nullable strings ("12", <NA>), cast by Arrow when it is installed """
+    if STRING_DTYPE is None:
+        return series.astype(object).where(series.notna(), np.nan).map(str, na_action='ignore')
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    values = pc.cast(pa.array(series.array), pa.large_string())
+    return pd.Series(pd.arrays.ArrowStringArray(values), index=series.index)
+
+
+CONVERTERS = {CATEGORY: _as_category, STRING: _as_string, DATE: _as_date, INTEGER: _as_integer}
+
+
+def apply_schema(df, schema):
+    """ df with each column in `schema` converted where that loses nothing; other columns untouched """
+    if df is None:
+        return None
+    columns = {
+        col: CONVERTERS[kind](df[col])
+        for col, kind in schema.items()
+        if col in df.columns and _is_text(df[col])
+    }
+    return df.assign(**columns) if columns else df
+
+
+def tableau_frame(df):
+    return apply_schema(df, TABLEAU_SCHEMA)
+
+
+def upload_frame(df):
+    return apply_schema(df, UPLOAD_SCHEMA)
+
+
+def as_object(series):
+    """ Column values as an object array, with NaN for every kind of missing value """
+    return series.to_numpy(dtype=object, na_value=np.nan)
+
+
+def output_frame(df):
+    """ Categoricals, nullable strings and nullable integers back to plain object columns """
+    columns = {
+        col: pd.Series(as_object(df[col]), index=df.index, dtype=object)
+        for col in df.columns if _is_lean(df[col].dtype)
+    }
+    return df.assign(**columns) if columns else df
+
+
+def _is_lean(dtype):
+    if isinstance(dtype, (pd.CategoricalDtype, pd.Int64Dtype)):
+        return True
+    # pandas' default "str" dtype (NaN for missing) is left as it is
+    return isinstance(dtype, pd.StringDtype) and dtype.na_value is pd.NA
@@ -0,0 +1,47 @@
+import os
+import pandas as pd
+
+# Rows read from the top of each sheet looking for the header; exports can put blank or title rows above it
+HEADER_SCAN_ROWS = 20
+
+
+def find_header(file_path, column="Date of Service"):
+    """ (sheet, header row) for the first sheet with `column` in its header, found without parsing any sheet body.
+    The row is 0-based, as pandas.read_excel takes it for `header` """
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        # read_only streams the sheet XML, so only the rows above the header are read
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for ws in wb.worksheets:
+                for row, values in enumerate(ws.iter_rows(max_row=HEADER_SCAN_ROWS, values_only=True)):
+                    if column in values:
+                        return ws.title, row
+        finally:
+            wb.close()
+    else:
+        xl = pd.ExcelFile(file_path)
+        for sheet in xl.sheet_names:
+            try:
+                top = xl.parse(sheet, header=None, nrows=HEADER_SCAN_ROWS)
+            except Exception:
+                continue
+            for row, values in enumerate(top.itertuples(index=False, name=None)):
+                if column in values:
+                    return sheet, row
+
+    raise ValueError(f"No sheet contains '{column}' column")
+
+
+def find_sheet(file_path, column="Date of Service"):
+    """ First sheet whose header row contains `column` """
+    return find_header(file_path, column)[0]
+
+
+def read_sheet(file_path, column="Date of Service", **kwargs):
+    """ pandas.read_excel on the sheet and header row find_header picks """
+    sheet, header = find_header(file_path, column)
+    return pd.read_excel(file_path, sheet_name=sheet, header=header, **kwargs)
@@ -0,0 +1,191 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import pandas as pd
+from config import CACHE_DIR, CACHE_REFRESH_DAYS, EXTRACT_LRU_MAX_MB, EXTRACT_LRU_MAX_AGE
+from schema import parse_dos
+
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_").lower()
+
+
+def dos_days(dos):
+    """ Tableau DOS values ("1/5/2024" or datetime64) as YYYY-MM-DD day strings """
+    return parse_dos(dos).dt.strftime(DAY_FORMAT)
+
+
+class TableauCache:
+    # Parquet extract per (view, license key, DOS day) plus a manifest of when each day was fetched
+    def __init__(self, cache_dir=CACHE_DIR, refresh_days=CACHE_REFRESH_DAYS):
+        import pyarrow  # noqa: F401  (parquet engine, fail early if missing)
+
+        self.cache_dir = cache_dir
+        self.refresh_days = refresh_days
+
+    def _dir(self, view_name, license_key):
+        return os.path.join(self.cache_dir, _slug(view_name), license_key or "all")
+
+    def _manifest_path(self, view_name, license_key):
+        return os.path.join(self._dir(view_name, license_key), "manifest.json")
+
+    def _day_path(self, view_name, license_key, day):
+        return os.path.join(self._dir(view_name, license_key), f"{day}.parquet")
+
+    def _load_manifest(self, view_name, license_key):
+        try:
+            with open(self._manifest_path(view_name, license_key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_manifest(self, view_name, license_key, manifest):
+        path = self._manifest_path(view_name, license_key)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
+        os.replace(tmp, path)
+
+    def missing_days(self, view_name, license_key, days):
+        """ Days that were never fetched, or were fetched before they had settled """
+        manifest = self._load_manifest(view_name, license_key)
+        settle = timedelta(days=self.refresh_days)
+        missing = []
+        for day in days:
+            fetched_at = manifest.get(day)
+            if fetched_at is None or (
+                datetime.fromisoformat(fetched_at) - datetime.strptime(day, DAY_FORMAT) < settle
+            ):
+                missing.append(day)
+        return missing
+
+    def store(self, view_name, license_key, days, df):
+        """
+        Save the rows fetched for `days`. Days without rows are recorded as empty.
+        Rows without a readable DOS belong to no day file, so when there are any nothing is
+        stored and their count is returned; the caller keeps the download and these days are
+        fetched again next time.
+        """
+        by_day = {}
+        if df is not None and len(df):
+            day = dos_days(df["DOS"])
+            undated = int(day.isna().sum())
+            if undated:
+                return undated
+            by_day = dict(tuple(df.groupby(day, sort=False)))
+
+        os.makedirs(self._dir(view_name, license_key), exist_ok=True)
+        manifest = self._load_manifest(view_name, license_key)
+        fetched_at = datetime.now().isoformat(timespec="seconds")
+
+        for day in days:
+            path = self._day_path(view_name, license_key, day)
+            if day in by_day:
+                by_day[day].to_parquet(path, index=False)
+            elif os.path.exists(path):
+                os.remove(path)
+            manifest[day] = fetched_at
+
+        self._save_manifest(view_name, license_key, manifest)
+        return 0
+
+    def load(self, view_name, license_key, days):
+        frames = []
+        for day in days:
+            path = self._day_path(view_name, license_key, day)
+            if os.path.exists(path):
+                frames.append(pd.read_parquet(path))
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    def invalidate(self, view_name=None, license_key=None, days=None):
+        """ Drop cached days. With no arguments the whole cache is cleared """
+        if view_name is None:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            return
+        if days is None:
+            shutil.rmtree(self._dir(view_name, license_key), ignore_errors=True)
+            return
+
+        manifest = self._load_manifest(view_name, license_key)
+        for day in days:
+            manifest.pop(day, None)
+            path = self._day_path(view_name, license_key, day)
+            if os.path.exists(path):
+                os.remove(path)
+        if os.path.isdir(self._dir(view_name, license_key)):
+            self._save_manifest(view_name, license_key, manifest)
+
+
+class ExtractLRU:
+    """
+    Extracts fetched this session, keyed by (view, license key, first day, last day).
+    A request for a day range inside an entry's range is answered by slicing that entry,
+    unless the entry has rows without a readable DOS, which no slice could place.
+    Least recently used entries are dropped once the total exceeds max_bytes.
+    """
+    def __init__(self, max_bytes=EXTRACT_LRU_MAX_MB * 2**20, max_age=EXTRACT_LRU_MAX_AGE):
+        self.max_bytes = max_bytes
+        # Seconds before an entry is fetched again, so recent, still-changing days get refreshed
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def get(self, view_name, license_key, days):
+        """ Rows for the contiguous YYYY-MM-DD `days`, or None if no entry covers them """
+        if not days:
+            return None
+        first, last = days[0], days[-1]
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in reversed(self._entries.items()):
+                if key[:2] != (view_name, license_key) or now - entry["stored"] > self.max_age:
+                    continue
+                if entry["undated"] and (first, last) != key[2:]:
+                    continue
+                if key[2] <= first and last <= key[3]:
+                    self._entries.move_to_end(key)
+                    df, day = entry["df"], entry["day"]
+                    break
+            else:
+                return None
+
+        # Extracts are only read downstream, so an exact hit shares the stored frame
+        if (first, last) == key[2:]:
+            return df
+        inside = (day >= pd.Timestamp(first)) & (day <= pd.Timestamp(last))
+        return df[inside.to_numpy()].reset_index(drop=True)
+
+    def put(self, view_name, license_key, days, df):
+        if not days or df is None:
+            return
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        day = parse_dos(df["DOS"]).dt.normalize()
+        entry = {"df": df, "day": day, "undated": bool(day.isna().any()), "bytes": nbytes, "stored": time.monotonic()}
+        key = (view_name, license_key, days[0], days[-1])
+        with self._lock:
+            # An entry inside the new range adds nothing
+            for old in [k for k in self._entries if k[:2] == key[:2] and key[2] <= k[2] and k[3] <= key[3]]:
+                self.nbytes -= self._entries.pop(old)["bytes"]
+            self._entries[key] = entry
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self.nbytes -= dropped["bytes"]
+
+    def invalidate(self, view_name=None, license_key=None):
+        with self._lock:
+            for key in list(self._entries):
+                if view_name is None or key[:2] == (view_name, license_key):
+                    self.nbytes -= self._entries.pop(key)["bytes"]
@@ -1,20 +1,113 @@
-from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import threading
 import tableauserverclient as TSC
 import pandas as pd
 from pandas.errors import EmptyDataError
-from io import BytesIO
+import io
 from datetime import datetime, timedelta
+from lookups import EncounterLookup, PatientInfoLookup, build_lookups
+from tableau_session import TableauSession
+from tableau_cache import ExtractLRU
+from config import SERVER_URL, EXTRACT_LRU_MAX_MB
+from instrumentation import NULL_TRACER
+from schema import tableau_frame
+
+
+def normalize_date(d):
+    return datetime.strptime(d, "%m/%d/%Y").strftime("%Y-%m-%d")
+
+
+def generate_dates(from_date, to_date):
+    date_format = "%Y-%m-%d"
+    from_date = datetime.strptime(from_date, date_format)
+    to_date = datetime.strptime(to_date, date_format)
+
+    dates = []
+    current_date = from_date
+    while current_date <= to_date:
+        dates.append(current_date.strftime(date_format))
+        current_date += timedelta(days=1)
+
+    return dates
+
+
+def split_windows(dates, window_days=None):
+    # One window for the whole range unless a window size is configured
+    if not window_days:
+        return [dates] if dates else []
+    return [dates[i:i + window_days] for i in range(0, len(dates), window_days)]
+
+
+# Columns the reconciliation steps read from the Tableau export
+TABLEAU_COLUMNS = {
+    'Last Name', 'FirstName', 'Patient Name', 'DOS', 'DOB', 'Chart Number',
+    'Appointment FID', 'Charge Code', 'Provider', 'Carrier', 'Facility Name',
+}
+
+
+class ChunkStream(io.RawIOBase):
+    # Read-only file over the byte chunks TSC yields, so pandas parses while downloading
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            try:
+                self._pending = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def read_csv_stream(chunks, chunk_rows=100_000):
+    """ Parse CSV byte chunks incrementally with the C engine, keeping only TABLEAU_COLUMNS """
+    stream = io.BufferedReader(ChunkStream(chunks), buffer_size=1 << 20)
+    try:
+        # No usecols here: the C parser stops reporting bad lines when it is set
+        reader = pd.read_csv(stream, dtype=str, on_bad_lines='warn', chunksize=chunk_rows)
+    except EmptyDataError:
+        return None
+
+    with reader:
+        frames = [chunk[[c for c in chunk.columns if c in TABLEAU_COLUMNS]] for chunk in reader]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
 
 class TableauFetcher:
     #
-    def __init__(self, username, password, output_callback=None, progress_callback=None):
+    def __init__(self, username, password, output_callback=None, progress_callback=None,
+                 window_days=None, max_workers=4, cache=None, session=None, csv_chunk_rows=100_000,
+                 server_url=SERVER_URL, lru_max_mb=EXTRACT_LRU_MAX_MB):
         self.username = username
         self.password = password
-        self.encounter_lookup = defaultdict(lambda: defaultdict(list))
-        self.patient_info_lookup = {}
+        # Signed-in server reused across fetches; TableauApp passes the one it logged in with
+        self.session = session or TableauSession(username, password, server_url)
+        self.encounter_lookup = EncounterLookup()
+        self.patient_info_lookup = PatientInfoLookup()
         self.df_tableau = None
         self.output_callback = output_callback
         self.progress_callback = progress_callback
+        # DOS days per request, e.g. 7 for one week per window. None = single request
+        self.window_days = window_days
+        self.max_workers = max_workers
+        # Rows parsed per CSV chunk while a window downloads
+        self.csv_chunk_rows = csv_chunk_rows
+        # Optional TableauCache; only missing or unsettled days are requested from Tableau
+        self.cache = cache
+        # Extracts already fetched this session, sliced for any DOS range they cover. 0 = off
+        self.extracts = ExtractLRU(lru_max_mb * 2**20) if lru_max_mb else None
+        # (view, license key, first day, last day) -> Future for downloads in progress
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
 
     def _safe_insert(self, text):
         if self.output_callback:
@@ -26,97 +119,165 @@ class TableauFetcher:
         if self.progress_callback:
             self.progress_callback(value)
 
+    def _fetch_window(self, license_key, target, dates, tracer=NULL_TRACER, parent=None):
+        opts = TSC.CSVRequestOptions()
+        opts.max_rows = -1
+        opts.include_all_columns = True
+        opts.vf("DOS", ",".join(dates))
+        if license_key in ('160214', '137797'):
+            opts.vf("Charge Code", "")
+            opts.vf("Last Name", "")
+            opts.vf("License Key", license_key)
+            opts.vf("CPT Code", "")
+
+        def download(server):
+            view = self.session.get_view(target)
+            server.views.populate_csv(view, req_options=opts)
+            return read_csv_stream(view.csv, self.csv_chunk_rows)
+
+        with tracer.stage("download window", parent=parent, days=len(dates)) as span:
+            df = self.session.run(download)
+            span.rows = 0 if df is None else len(df)
+        return df
+
+    def _download(self, license_key, target, days, tracer=NULL_TRACER):
+        windows = split_windows(days, self.window_days)
+        if len(windows) > 1:
+            self._safe_insert(f"Fetching {len(windows)} DOS windows from Tableau...\n")
+
+        if not self.session.is_signed_in():
+            with tracer.stage("sign in"):
+                self.session.sign_in()
+        with tracer.stage("resolve view"):
+            self.session.get_view(target)
+        self._update_progress(0.05)
+
+        parent = tracer.current()
+
+        frames = [None] * len(windows)
+        workers = max(1, min(self.max_workers, len(windows)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(self._fetch_window, license_key, target, dates, tracer, parent): i
+                for i, dates in enumerate(windows)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                frames[futures[future]] = future.result()
+                self._update_progress(0.05 + 0.9 * done / len(windows))
+
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def rebuild_cache(self, license_key, filter_values):
+        # Forget the cached days for this client and fetch them again
+        if self.cache:
+            self.cache.invalidate(self._target_view(license_key), license_key)
+        if self.extracts:
+            self.extracts.invalidate(self._target_view(license_key), license_key)
+        return self.fetch_data(license_key, filter_values)
+
+    def _target_view(self, license_key):
+        if(license_key != ""):
+            return "EHP Census Reconciliation Details"
+        return "Concord Census Reconciliation View"
+
+    def _extract(self, license_key, target, days, tracer):
+        fetch_days = days
+        if self.cache:
+            with tracer.stage("cache lookup"):
+                fetch_days = self.cache.missing_days(target, license_key, days)
+            self._safe_insert(f"{len(days) - len(fetch_days)} of {len(days)} days loaded from cache.\n")
+
+        df = None
+        if fetch_days:
+            with tracer.stage("download", days=len(fetch_days)) as span:
+                df = self._download(license_key, target, fetch_days, tracer)
+                span.rows = 0 if df is None else len(df)
+        if self.cache:
+            with tracer.stage("cache store"):
+                undated = self.cache.store(target, license_key, fetch_days, df)
+            if undated:
+                self._safe_insert(f"{undated} rows have no readable DOS; {len(fetch_days)} downloaded days were not cached.\n")
+            with tracer.stage("cache load") as span:
+                if undated:
+                    # Cached days plus the download as it came, so no row is lost
+                    downloaded = set(fetch_days)
+                    cached = self.cache.load(target, license_key, [day for day in days if day not in downloaded])
+                    df = df if cached is None else pd.concat([cached, df], ignore_index=True)
+                else:
+                    df = self.cache.load(target, license_key, days)
+                span.rows = 0 if df is None else len(df)
+        # Categorical, Arrow string and datetime columns for the copy kept all session
+        with tracer.stage("apply schema", rows=0 if df is None else len(df)):
+            return tableau_frame(df)
+
+    def _shared_extract(self, license_key, target, days, tracer):
+        # An identical request already downloading is waited for instead of started again
+        if not days:
+            return self._extract(license_key, target, days, tracer)
+        key = (target, license_key, days[0], days[-1])
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            self._safe_insert("The same Tableau fetch is already running, waiting for it...\n")
+            with tracer.stage("wait for fetch"):
+                return future.result()
 
-    def fetch_data(self, license_key, filter_values):
         try:
-            tableau_auth = TSC.TableauAuth(self.username, self.password, '')
-            server = TSC.Server(
-                "https://tableau.blitzmedical.com",
-                use_server_version=True
-            )
-            server.add_http_options({'timeout': 3600})
-
-            with server.auth.sign_in(tableau_auth):
-                self._update_progress(0.05)
-                target = "Concord Census Reconciliation View"
-                if(license_key != ""):
-                    target = "EHP Census Reconciliation Details"
-                all_views = list(TSC.Pager(server.views))
-                oldest_dos = filter_values
-                yesterday = (datetime.today() - timedelta(days=1)).strftime("%#m/%#d/%Y")
-                
-                matched_views = [view for view in all_views if view.name == target]
-                target_view = matched_views[0]
-                opts = TSC.CSVRequestOptions()
-                opts.max_rows = -1
-                opts.include_all_columns = True
-
-                def generate_dates(from_date, to_date):
-                    date_format = "%Y-%m-%d"
-                    from_date = datetime.strptime(from_date, date_format)
-                    to_date = datetime.strptime(to_date, date_format)
-
-                    dates = []
-                    current_date = from_date
-                    while current_date <= to_date:
-                        dates.append(current_date.strftime(date_format))
-                        current_date += timedelta(days=1)
-
-                    return ",".join(dates)
-
-                def normalize_date(d):
-                    return datetime.strptime(d, "%m/%d/%Y").strftime("%Y-%m-%d")
-                
-                start = normalize_date(oldest_dos)
-                end = normalize_date(yesterday)
-                date_range = generate_dates(start, end)
-                opts.vf("DOS", date_range)
-                if license_key in ('160214', '137797'):
-                    opts.vf("Charge Code", "")
-                    opts.vf("Last Name", "")
-                    opts.vf("License Key", license_key)
-                    opts.vf("CPT Code")
-                server.views.populate_csv(target_view, req_options=opts)
-                slice_bytes = b"".join (target_view.csv)
-                if not slice_bytes.strip():
+            df = self._extract(license_key, target, days, tracer)
+            if self.extracts:
+                self.extracts.put(target, license_key, days, df)
+            future.set_result(df)
+            return df
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def fetch_data(self, license_key, filter_values, tracer=None):
+        tracer = tracer or NULL_TRACER
+        try:
+            target = self._target_view(license_key)
+            oldest_dos = filter_values
+            yesterday = (datetime.today() - timedelta(days=1)).strftime("%#m/%#d/%Y")
+            start = normalize_date(oldest_dos)
+            end = normalize_date(yesterday)
+            days = generate_dates(start, end)
+
+            with tracer.stage("fetch", days=len(days)) as fetch_span:
+                df = None
+                if self.extracts:
+                    with tracer.stage("session extracts") as span:
+                        df = self.extracts.get(target, license_key, days)
+                        span.rows = None if df is None else len(df)
+                if df is not None:
+                    self._safe_insert(f"Reusing {len(df)} Tableau rows already fetched this session.\n")
+                else:
+                    df = self._shared_extract(license_key, target, days, tracer)
+
+                if df is None:
                     self._safe_insert("No rows returned from Tableau.\n")
                     self._update_progress(1)
                     return None
 
-                try:
-                    df = pd.read_csv(BytesIO(slice_bytes), on_bad_lines='warn', engine="python")
-                except EmptyDataError:
-                    self._safe_insert("Returned CSV had no columns.\n")
-                    self._update_progress(1)
-                    return None
-                
                 # If needed, build encounter lookups for license-key mode
                 if license_key in ('160214', '137797'):
-                    total_rows = len(df)
-                    for i, (_, row) in enumerate(df.iterrows()):
-                        last = str(row['Last Name']).strip().upper()
-                        first = str(row['FirstName']).strip().upper()
-                        code = str(row['Charge Code']).strip().upper()
-                        dos = str(row['DOS']).strip()
-                        appointment_num = str(row['Appointment FID']).strip()
-                        dob = str(row['DOB']).strip()
-                        mrn = str(row['Chart Number']).strip()
-                        name_key = (last, first)
-                        provider = str(row.get('Provider', '')).strip()
-
-                        if name_key not in self.patient_info_lookup:
-                            self.patient_info_lookup[name_key] = {"dob": dob, "mrn": mrn}
-
-                        if (code, dos) not in [(c, d) for c, d, _ in self.encounter_lookup[(last, first)][appointment_num]]:
-                            self.encounter_lookup[(last, first)][appointment_num].append((code, dos, provider))
-
-                        if i % max(1, total_rows // 20) == 0:
-                            self._update_progress(40 + int(((i / total_rows) * 60)) / 100 )
-                self._safe_insert(f"Retrieved {len(df)} rows from Tableau. ")
-                self.df_tableau = df
-                self._update_progress(1)
-                
-                return df
+                    with tracer.stage("build lookups", rows=len(df)):
+                        self.encounter_lookup, self.patient_info_lookup = build_lookups(df)
+                fetch_span.rows = len(df)
+            self._safe_insert(f"Retrieved {len(df)} rows from Tableau. ")
+            self.df_tableau = df
+            self._update_progress(1)
+            
+            return df
 
         except Exception as e:
             self._safe_insert(f"Error fetching Tableau data: {e}\n")
@@ -0,0 +1,73 @@
+import copy
+import threading
+import tableauserverclient as TSC
+from config import SERVER_URL
+
+
+def _is_auth_error(error):
+    if isinstance(error, TSC.NotSignedInError):
+        return True
+    # 401xxx codes mean the token expired or was revoked
+    return isinstance(error, TSC.ServerResponseError) and str(error.code).startswith("401")
+
+
+class TableauSession:
+    # One signed-in server shared by the login screen and every fetch
+    def __init__(self, username, password, server_url=SERVER_URL, timeout=3600):
+        self.username = username
+        self.password = password
+        self.server_url = server_url
+        self.timeout = timeout
+        self.server = None
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def sign_in(self, stale_token=None):
+        with self._lock:
+            # Another thread already signed in again while we waited
+            if stale_token is not None and self.server.auth_token != stale_token:
+                return self.server
+
+            if self.server is None:
+                self.server = TSC.Server(self.server_url, use_server_version=True)
+                self.server.add_http_options({'timeout': self.timeout})
+            self.server.auth.sign_in(TSC.TableauAuth(self.username, self.password, ''))
+            return self.server
+
+    def is_signed_in(self):
+        return self.server is not None and self.server.is_signed_in()
+
+    def sign_out(self):
+        with self._lock:
+            if self.is_signed_in():
+                self.server.auth.sign_out()
+
+    def run(self, func):
+        """ Call func(server), signing in again once if the token has expired """
+        if not self.is_signed_in():
+            self.sign_in()
+        token = self.server.auth_token
+        try:
+            return func(self.server)
+        except Exception as e:
+            if not _is_auth_error(e):
+                raise
+        return func(self.sign_in(stale_token=token))
+
+    def get_view(self, name):
+        """ View by exact name, resolved once with a server-side filter and then cached """
+        if name not in self._views:
+            opts = TSC.RequestOptions()
+            opts.filter.add(TSC.Filter(
+                TSC.RequestOptions.Field.Name,
+                TSC.RequestOptions.Operator.Equals,
+                name
+            ))
+            views, _ = self.run(lambda server: server.views.get(opts))
+            matched_views = [view for view in views if view.name == name]
+            if not matched_views:
+                raise LookupError(f"Tableau view not found: {name}")
+            self._views[name] = matched_views[0]
+
+        # populate_csv stores data on the item, so callers get their own copy
+        return copy.copy(self._views[name])
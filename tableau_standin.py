@@ -0,0 +1,237 @@
+"""
+Local stand-in for the Tableau REST endpoints TableauFetcher uses: server info,
+sign in/out, view lookup by name and CSV view data filtered with vf_ parameters.
+
+    python tableau_standin.py --port 8765 --rows-per-day 2000 --latency 0.5
+    python tableau_standin.py --replay recorded_census.csv
+
+Point the app at it with TABLEAU_SERVER_URL=http://127.0.0.1:8765
+"""
+import argparse
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import quoteattr
+import numpy as np
+import pandas as pd
+
+API_VERSION = "3.19"
+SITE_ID = "standin-site"
+VIEWS = {
+    "view-ehp": "EHP Census Reconciliation Details",
+    "view-concord": "Concord Census Reconciliation View",
+}
+LICENSE_KEYS = ["160214", "137797"]
+
+
+def synthetic_day(day, rows, seed=0):
+    """ Census rows for one DOS day; the same day always generates the same rows """
+    rng = np.random.default_rng([seed, int(day.strftime("%Y%m%d"))])
+    lasts = np.array(["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "LOPEZ-DIAZ", "O'NEIL"])
+    firsts = np.array(["JAMES", "MARY", "ROBERT", "PATRICIA", "JOHN", "JENNIFER", "MICHAEL", "LINDA", "DAVID JR", "ANN MARIE"])
+    codes = np.array(["99281", "99282", "99283", "99284", "99285", "LWBS", "AMA", "0", "NULL", "12345"])
+    last = rng.choice(lasts, rows)
+    first = rng.choice(firsts, rows)
+    dos = f"{day.month}/{day.day}/{day.year}"
+    return pd.DataFrame({
+        "Last Name": last,
+        "FirstName": first,
+        "Patient Name": np.char.add(np.char.add(last, ", "), first),
+        "DOS": dos,
+        "DOB": [f"{m}/{d}/{y}" for m, d, y in zip(rng.integers(1, 13, rows), rng.integers(1, 29, rows), rng.integers(1940, 2020, rows))],
+        "Chart Number": rng.integers(100000, 999999, rows).astype(str),
+        "Appointment FID": rng.integers(1, 10_000_000, rows).astype(str),
+        "Charge Code": rng.choice(codes, rows, p=[.05, .1, .2, .25, .2, .05, .05, .04, .03, .03]),
+        "CPT Code": "",
+        "License Key": rng.choice(LICENSE_KEYS, rows),
+        "Provider": rng.choice(["DR ADAMS", "DR BAKER", "DR CLARK", "DR DIAZ"], rows),
+        "Carrier": rng.choice(["MEDICARE", "MEDICAID", "AETNA", "SELF PAY"], rows),
+        "Facility Name": rng.choice(["NORTH ED", "SOUTH ED", "WEST ED"], rows),
+    })
+
+
+class CensusSource:
+    # Rows served for a view: a replayed CSV export, or synthetic rows per day
+    def __init__(self, replay_path=None, rows_per_day=1000, seed=0):
+        self.rows_per_day = rows_per_day
+        self.seed = seed
+        self.replay = None
+        if replay_path:
+            self.replay = pd.read_csv(replay_path, dtype=str)
+            self.replay["_day"] = pd.to_datetime(self.replay["DOS"], format="mixed", errors="coerce").dt.strftime("%Y-%m-%d")
+
+    def rows(self, filters):
+        days = [d for d in filters.get("DOS", "").split(",") if d]
+        if self.replay is not None:
+            df = self.replay[self.replay["_day"].isin(days)].drop(columns="_day")
+        else:
+            frames = [synthetic_day(datetime.strptime(d, "%Y-%m-%d"), self.rows_per_day, self.seed) for d in days]
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+        license_key = filters.get("License Key")
+        if license_key and "License Key" in df.columns:
+            df = df[df["License Key"] == license_key]
+        return df
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="application/xml"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _xml(self, inner, status=200):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><tsResponse xmlns="http://tableau.com/api">{inner}</tsResponse>'
+        self._send(status, body.encode())
+
+    def _error(self, status, code, summary):
+        self._xml(f'<error code="{code}"><summary>{summary}</summary><detail>{summary}</detail></error>', status)
+
+    def _authorized(self):
+        token = self.headers.get("X-Tableau-Auth")
+        issued = self.server.tokens.get(token)
+        if issued is None or (self.server.token_ttl and time.time() - issued > self.server.token_ttl):
+            self._error(401, "401002", "Unauthorized Access")
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        query = parse_qs(url.query)
+
+        if parts[-1] == "serverInfo":
+            return self._xml(
+                f'<serverInfo><productVersion build="standin">2023.3</productVersion>'
+                f'<restApiVersion>{API_VERSION}</restApiVersion></serverInfo>'
+            )
+
+        if len(parts) >= 5 and parts[2] == "sites" and parts[4] == "views":
+            if not self._authorized():
+                return
+            self.server.counts["requests"] += 1
+            if len(parts) == 5:
+                return self._list_views(query)
+            if len(parts) == 7 and parts[6] == "data":
+                return self._view_data(parts[5], query)
+            if len(parts) == 6 and parts[5] in VIEWS:
+                return self._xml(self._view_xml(parts[5]))
+
+        self._error(404, "404000", "Resource Not Found")
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        if parts[-2:] == ["auth", "signin"]:
+            time.sleep(self.server.latency)
+            token = uuid.uuid4().hex
+            self.server.tokens[token] = time.time()
+            self.server.counts["sign_ins"] += 1
+            return self._xml(
+                f'<credentials token="{token}"><site id="{SITE_ID}" contentUrl=""/>'
+                f'<user id="standin-user"/></credentials>'
+            )
+        if parts[-2:] == ["auth", "signout"]:
+            self.server.tokens.pop(self.headers.get("X-Tableau-Auth"), None)
+            return self._send(204, b"")
+
+        self._error(404, "404000", "Resource Not Found")
+
+    def _view_xml(self, view_id):
+        return f'<view id="{view_id}" name={quoteattr(VIEWS[view_id])} contentUrl="standin/sheets/{view_id}"/>'
+
+    def _list_views(self, query):
+        self.server.counts["view_listings"] += 1
+        names = None
+        for f in query.get("filter", []):
+            field, op, value = f.split(":", 2)
+            if field == "name" and op == "eq":
+                names = {value}
+        views = "".join(self._view_xml(v) for v, name in VIEWS.items() if names is None or name in names)
+        total = views.count("<view ")
+        self._xml(f'<pagination pageNumber="1" pageSize="100" totalAvailable="{total}"/><views>{views}</views>')
+
+    def _view_data(self, view_id, query):
+        if view_id not in VIEWS:
+            return self._error(404, "404011", "View Not Found")
+        self.server.counts["csv_downloads"] += 1
+        filters = {k[3:]: v[-1] for k, v in query.items() if k.startswith("vf_")}
+        df = self.server.source.rows(filters)
+        body = df.to_csv(index=False).encode() if len(df.columns) else b""
+
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # Throttle to the configured bandwidth so large extracts take realistic time
+        step = 64 * 1024
+        for i in range(0, len(body), step):
+            self.wfile.write(body[i:i + step])
+            if self.server.bandwidth:
+                time.sleep(step / self.server.bandwidth)
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, source=None, latency=0.0, bandwidth=None, token_ttl=None, verbose=False):
+        super().__init__(("127.0.0.1", port), StandinHandler)
+        self.source = source or CensusSource()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.token_ttl = token_ttl
+        self.verbose = verbose
+        self.tokens = {}
+        self.counts = {"sign_ins": 0, "view_listings": 0, "csv_downloads": 0, "requests": 0}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Tableau stand-in for offline fetch testing")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--replay", help="Recorded census CSV to serve instead of synthetic rows")
+    parser.add_argument("--rows-per-day", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each sign-in / CSV response")
+    parser.add_argument("--bandwidth", type=float, help="CSV bytes per second")
+    parser.add_argument("--token-ttl", type=float, help="Seconds before auth tokens expire")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = StandinServer(
+        port=args.port,
+        source=CensusSource(args.replay, args.rows_per_day, args.seed),
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        token_ttl=args.token_ttl,
+        verbose=args.verbose,
+    )
+    print(f"Tableau stand-in listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+from config import UPLOAD_SIDECARS
+from sheets import read_sheet
+from schema import upload_frame
+
+# Parsed uploads kept in memory, keyed by (path, mtime, size)
+MAX_CACHED_UPLOADS = 4
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_key_locks = {}
+
+
+def _key(file_path):
+    st = os.stat(file_path)
+    return (os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+
+
+def _sidecar_path(key):
+    path, mtime_ns, size = key
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{name}.{size}-{mtime_ns}.parquet")
+
+
+def _parse(file_path):
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        # Text columns, same as the chunked Concord reader
+        return upload_frame(pd.read_csv(file_path, dtype=str))
+    return upload_frame(read_sheet(file_path))
+
+
+def cached_upload(file_path):
+    """ The parsed upload if it is already in memory for this exact file version, else None """
+    with _cache_lock:
+        df = _cache.get(_key(file_path))
+    return None if df is None else df.copy()
+
+
+def load_upload(file_path, sidecar=UPLOAD_SIDECARS):
+    """ Upload parsed once per file version; callers get their own copy to modify """
+    key = _key(file_path)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key].copy()
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Concurrent callers for the same file wait for one parse instead of starting another
+    with key_lock:
+        with _cache_lock:
+            if key in _cache:
+                return _cache[key].copy()
+
+        df = None
+        sidecar_path = _sidecar_path(key)
+        if sidecar and os.path.exists(sidecar_path):
+            try:
+                df = pd.read_parquet(sidecar_path)
+            except Exception:
+                df = None
+        if df is None:
+            df = _parse(file_path)
+            if sidecar:
+                try:
+                    df.to_parquet(sidecar_path, index=False)
+                except Exception:
+                    # Columns parquet can't store (mixed types); parse the file next time
+                    if os.path.exists(sidecar_path):
+                        os.remove(sidecar_path)
+
+        with _cache_lock:
+            _cache[key] = df
+            while len(_cache) > MAX_CACHED_UPLOADS:
+                _cache.popitem(last=False)
+            _key_locks.pop(key, None)
+        return df.copy()